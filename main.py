@@ -1,18 +1,22 @@
 import logging
 import random
-import pandas as pd
 import streamlit as st
 import os
 import sys
-from typing import Any, Dict, Generator
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Dict, List
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from dotenv import load_dotenv
 from config import suggestions
-from services import OpenAIService, WaybackService, SemanticRouterService
-from utils.trend_analysis import analyze_trends
+import services
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 load_dotenv()
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "120"))
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "4"))
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -39,15 +43,16 @@ def initialize_services():
         st.stop()
 
     try:
-        return OpenAIService(openai_api_key), WaybackService(), SemanticRouterService()
+        return (
+            services.OpenAIService(openai_api_key),
+            services.WaybackService(),
+            services.SemanticRouterService(),
+        )
     except ValueError as e:
         st.error(f"Error initializing services: {str(e)}")
         st.stop()
 
 
-openai_service, wayback_service, semantic_router = initialize_services()
-
-
 # display all suggestions in the sidebar as text, make the suggestionn shown in sidebar expander
 def suggestions_fragment():
     with st.sidebar.expander("View Suggestions"):
@@ -75,50 +80,101 @@ def process_user_input(user_input: str):
 
     # Get OpenAI response, which may include a function call
     try:
-        response = openai_service.get_completion(messages_for_openai)
+        response = openai_service.get_completion(messages_for_openai, stream=True)
         if response is None:
             st.error("Received an invalid response from OpenAI service.")
             return
 
-        if response and response.function_call:
-            # OpenAI has decided to call a function
-            function_name = response.function_call.name
-            function_args = openai_service.get_function_args(response.function_call)
+        response_content = ""
+        if not response.tool_calls:
+            # Text streams first, tool calls may still follow it
+            with st.chat_message("assistant", avatar="assets/favicon.ico"):
+                response_content = st.write_stream(response)
 
-            # Ensure args is correctly structured
-            if "url" in function_args:
-                function_args["url"] = str(
-                    function_args["url"]
-                )  # Convert URL to string if necessary
-
-            # Execute the function
-            result = execute_function(function_name, function_args)
-
-            # Add the function result to the messages
+        if response.tool_calls:
+            # OpenAI has decided to call one or more tools, run them in parallel
+            results = execute_tool_calls(response.tool_calls)
             st.session_state.messages.append(
                 {
-                    "role": "function",
-                    "name": str(function_name),
-                    "content": str(result),
+                    "role": "assistant",
+                    "content": response.content or None,
+                    "tool_calls": [
+                        call.model_dump(exclude_none=True)
+                        for call in response.tool_calls
+                    ],
                 }
             )
-
-            # Get a new response from OpenAI with the function result
-            final_response = openai_service.get_completion(st.session_state.messages)
-            response_content = final_response.content
-        else:
-            # No function call, use the initial response
-            response_content = (
-                response.content if response else "No response generated."
+            for call, result in zip(response.tool_calls, results):
+                st.session_state.messages.append(
+                    {
+                        "role": "tool",
+                        "tool_call_id": call.id,
+                        "content": str(result),
+                    }
+                )
+
+            # Stream a new response from OpenAI with all tool results
+            response = openai_service.get_completion(
+                st.session_state.messages, stream=True
             )
+            with st.chat_message("assistant", avatar="assets/favicon.ico"):
+                response_content = st.write_stream(response)
+
+        response_content = response_content or "No response generated."
 
     except Exception as e:
         st.error(f"Error processing request: {str(e)}")
         return
 
     st.session_state.messages.append({"role": "assistant", "content": response_content})
-    with st.chat_message("assistant", avatar="assets/favicon.ico"):
-        st.write_stream(stream_text(response_content))
+
+
+def execute_tool_calls(tool_calls) -> List[str]:
+    """Run `tool_calls` concurrently and return their results in order.
+
+    Each call gets `TOOL_TIMEOUT` seconds from submission; a call that fails or
+    times out gets an error message as its result, so the model still sees one
+    result per call. Worker threads are attached to the current script run,
+    so tools can write to the page.
+
+    The timeout only stops waiting for a call, a running thread cannot be
+    stopped. Its HTTP requests are bounded by the shared session's connect
+    and read timeouts, and each run has its own pool, which is not waited
+    for, so a hanging tool never holds up later runs or other sessions.
+    """
+    ctx = get_script_run_ctx()
+
+    def run(call):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        function_args = openai_service.get_function_args(call.function)
+        if "url" in function_args:
+            function_args["url"] = str(function_args["url"])
+        return execute_function(call.function.name, function_args)
+
+    deadline = time.monotonic() + TOOL_TIMEOUT
+    pool = ThreadPoolExecutor(
+        max_workers=max(min(len(tool_calls), TOOL_WORKERS), 1),
+        thread_name_prefix="tool",
+    )
+    futures = [pool.submit(run, call) for call in tool_calls]
+    results = []
+    try:
+        for call, future in zip(tool_calls, futures):
+            try:
+                timeout = max(deadline - time.monotonic(), 0)
+                results.append(future.result(timeout=timeout))
+            except TimeoutError:
+                logger.error(f"Tool {call.function.name} timed out")
+                results.append(
+                    f"Error: {call.function.name} timed out after {TOOL_TIMEOUT:g}s"
+                )
+            except Exception as e:
+                logger.error(f"Tool {call.function.name} failed: {e}")
+                results.append(f"Error: {call.function.name} failed: {e}")
+    finally:
+        # Timed out calls keep running in the background until they return
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
 
 
 def execute_function(function_name: str, args: Dict[str, Any]) -> str:
@@ -142,14 +198,6 @@ def execute_function(function_name: str, args: Dict[str, Any]) -> str:
         raise ValueError(f"Unknown function: {function_name}")
 
 
-def stream_text(text: str):
-    if text is None:
-        yield "No response generated."
-    else:
-        for char in text:
-            yield char
-
-
 # Main content
 # st.image("assets/favicon.ico", width=50)
 st.title("Archive Temporal History Exploration and Navigation Assistant")
@@ -164,16 +212,16 @@ if "messages" not in st.session_state:
 
 # Display chat history
 for msg in st.session_state.messages:
-    if msg["role"] in ["user", "assistant"]:
+    if msg["role"] in ["user", "assistant"] and msg.get("content"):
         avatar_path = "assets/favicon.ico" if msg["role"] == "assistant" else None
         with st.chat_message(msg["role"], avatar=avatar_path):
-            if msg["role"] == "assistant":
-                st.write_stream(stream_text(msg["content"]))
-            else:
-                st.write(msg["content"])
+            st.write(msg["content"])
 
 # Chat input
 user_input = st.chat_input("Type your message here...", key="user_input")
 
+# Initialize the services once the page is drawn, the router warms up meanwhile
+openai_service, wayback_service, semantic_router = initialize_services()
+
 if user_input:
     process_user_input(user_input)
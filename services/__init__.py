@@ -1,3 +1,18 @@
-from .openai_service import OpenAIService
-from .wayback_service import WaybackService
-from .semantic_router_service import SemanticRouterService
+import importlib
+
+# The services pull in openai and semantic_router, so they are imported on
+# first access rather than with the package.
+_exports = {
+    "OpenAIService": ".openai_service",
+    "WaybackService": ".wayback_service",
+    "SemanticRouterService": ".semantic_router_service",
+}
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
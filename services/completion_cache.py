@@ -0,0 +1,108 @@
+import hashlib
+import json
+import math
+import os
+
+from utils.cache import DiskCache, MemoryCache, TieredCache
+
+COMPLETION_CACHE_SIZE = int(os.getenv("COMPLETION_CACHE_SIZE", "256"))
+COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+COMPLETION_CACHE_DIR = os.getenv("COMPLETION_CACHE_DIR")
+COMPLETION_CACHE_SEMANTIC = os.getenv("COMPLETION_CACHE_SEMANTIC", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("COMPLETION_CACHE_SIMILARITY", "0.95"))
+MAXNEIGHBOURS = 32
+
+
+def _squeeze(v):
+    return " ".join(v.split()) if isinstance(v, str) else v
+
+
+def _normalize(messages):
+    return [
+        {k: _squeeze(v) for k, v in m.items() if v is not None} for m in messages
+    ]
+
+
+def completion_key(*parts):
+    """Return a SHA-256 hex digest of the canonical JSON of `parts`."""
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _last_user(messages):
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].get("role") == "user":
+            return i
+    return None
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class CompletionCache:
+    """Cache of chat completion messages keyed by a hash of the whole request.
+
+    The key covers the system prompt, model, function schemas and messages, so
+    any difference in context, including function results, is a miss. Entries
+    expire after `ttl` seconds and the memory tier evicts least recently used
+    ones beyond `maxsize`; with `cache_dir` they also persist on disk.
+
+    With an `embed(text) -> vector` callable, near-duplicate mode is enabled: on
+    an exact miss, a cached answer is reused if everything but the last user
+    message is identical and that message's embedding is at least `threshold`
+    cosine-similar to the one the answer was cached for. This only applies
+    once tool results follow the last user message, so answers are only
+    shared between questions whose tool results are identical.
+    """
+
+    def __init__(
+        self,
+        maxsize=COMPLETION_CACHE_SIZE,
+        ttl=COMPLETION_CACHE_TTL,
+        cache_dir=COMPLETION_CACHE_DIR,
+        embed=None,
+        threshold=SEMANTIC_THRESHOLD,
+    ):
+        self.cache = TieredCache(
+            MemoryCache(maxsize=maxsize, ttl=ttl),
+            DiskCache(cache_dir, ttl=ttl) if cache_dir else None,
+        )
+        self.embed = embed
+        self.threshold = threshold
+        self._neighbours = MemoryCache(maxsize=maxsize, ttl=ttl)
+
+    def lookup(self, system, model, functions, messages):
+        """Return `(cached message dict or None, entry)`; pass `entry` to `store`."""
+        messages = _normalize(messages)
+        entry = {"key": completion_key(system, model, functions, messages)}
+        value = self.cache.get(entry["key"])
+        if value is not None or self.embed is None:
+            return value, entry
+        i = _last_user(messages)
+        if i is None or not messages[i].get("content"):
+            return None, entry
+        if not any(m.get("role") == "tool" for m in messages[i + 1 :]):
+            # Before any tool has run a near-duplicate question may name
+            # another URL, so its cached tool calls must not be reused
+            return None, entry
+        masked = messages[:i] + [dict(messages[i], content="")] + messages[i + 1 :]
+        entry["prefix"] = completion_key(system, model, functions, masked)
+        entry["vector"] = self.embed(messages[i]["content"])
+        for vector, key in self._neighbours.get(entry["prefix"]) or []:
+            if _cosine(vector, entry["vector"]) >= self.threshold:
+                value = self.cache.get(key)
+                if value is not None:
+                    return value, entry
+        return None, entry
+
+    def store(self, entry, value):
+        self.cache.set(entry["key"], value)
+        if "prefix" in entry:
+            neighbours = self._neighbours.get(entry["prefix"]) or []
+            self._neighbours.set(
+                entry["prefix"],
+                (neighbours + [(entry["vector"], entry["key"])])[-MAXNEIGHBOURS:],
+            )
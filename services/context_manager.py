@@ -0,0 +1,173 @@
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "12000"))
+FUNCTION_RESULT_TOKENS = int(os.getenv("FUNCTION_RESULT_TOKENS", "400"))
+SUMMARY_CHARS = 200
+MESSAGE_OVERHEAD = 4
+# Column order of `fetch_cdx_data` rows, see `utils.cdxdata.CDX_FIELDS`
+CDX_TIMESTAMP, CDX_ORIGINAL, CDX_STATUS = 1, 2, 4
+TIMESTAMP_RE = re.compile(r"^\d{4,14}$")
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    """Return the tiktoken encoding of `model`, or None to use the estimate.
+
+    tiktoken downloads its BPE files on first use, so a failure to load them,
+    e.g. when offline, also falls back to the estimate.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Count the tokens of `text` with tiktoken, or estimate 4 characters per token."""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, limit, model="gpt-3.5-turbo"):
+    """Cut `text` to at most about `limit` tokens and say how much was cut."""
+    enc = _encoding(model)
+    if enc is None:
+        if len(text) <= limit * 4:
+            return text
+        return f"{text[: limit * 4]}\n[... truncated {len(text) - limit * 4} characters]"
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= limit:
+        return text
+    return f"{enc.decode(tokens[:limit])}\n[... truncated {len(tokens) - limit} tokens]"
+
+
+def message_tokens(message, model="gpt-3.5-turbo"):
+    return MESSAGE_OVERHEAD + sum(
+        count_tokens(v if isinstance(v, str) else json.dumps(v), model)
+        for k, v in message.items()
+        if isinstance(v, str) or k == "tool_calls"
+    )
+
+
+def _cdx_digest(rows, limit, model):
+    """Describe CDX rows by count, time span and status histogram, then
+    list as many of the last rows as fit in `limit` tokens."""
+    full = all(len(r) > CDX_STATUS for r in rows)
+    stamps = sorted(
+        str(v)
+        for r in rows
+        for v in ([r[CDX_TIMESTAMP]] if full else r[:2])
+        if TIMESTAMP_RE.match(str(v))
+    )
+    text = f"CDX result: {len(rows)} captures"
+    if stamps:
+        text += f" from {stamps[0]} to {stamps[-1]}"
+    if full:
+        statuses = Counter(str(r[CDX_STATUS]) for r in rows)
+        urls = list(dict.fromkeys(str(r[CDX_ORIGINAL]) for r in rows))
+        text += f", statuses {dict(statuses.most_common())}"
+        text += f", {len(urls)} distinct URLs, e.g. {', '.join(urls[:3])}"
+    text += ". Last rows:"
+    used = count_tokens(text, model)
+    for r in rows[::-1]:
+        line = "\n" + json.dumps(r)
+        used += count_tokens(line, model)
+        if used > limit:
+            break
+        text += line
+    return text
+
+
+def digest_result(content, limit=FUNCTION_RESULT_TOKENS, model="gpt-3.5-turbo"):
+    """Return a digest of a function result that fits in about `limit` tokens.
+
+    Results that fit are kept. A JSON list of CDX rows becomes a structured
+    summary, so no broken JSON is left in the prompt; any other result, e.g.
+    page text or a trend analysis, keeps its title line and lead text.
+    """
+    if count_tokens(content, model) <= limit:
+        return content
+    try:
+        rows = json.loads(content)
+    except ValueError:
+        rows = None
+    if isinstance(rows, list) and rows and all(isinstance(r, list) for r in rows):
+        return truncate_tokens(_cdx_digest(rows, limit, model), limit, model)
+    title, _, lead = content.strip().partition("\n")
+    lead = " ".join(lead.split())
+    return truncate_tokens(f"{title.strip()}\n{lead}".strip(), limit, model)
+
+
+def _summary(dropped):
+    asked = [
+        " ".join(m["content"].split())[:SUMMARY_CHARS]
+        for m in dropped
+        if m.get("role") == "user" and m.get("content")
+    ]
+    text = f"{len(dropped)} earlier messages were omitted to fit the context window."
+    if asked:
+        text += " Earlier the user asked: " + "; ".join(asked)
+    return {"role": "system", "content": text}
+
+
+def fit_messages(messages, budget=CONTEXT_TOKENS, model="gpt-3.5-turbo"):
+    """Return a copy of `messages` that fits in `budget` tokens.
+
+    The current turn, from the last user message on, is kept. Before it,
+    function results are replaced by digests of `FUNCTION_RESULT_TOKENS` tokens
+    (see `digest_result`) and then the oldest messages are dropped, together
+    with any tool results left without their calls, replaced by a short system
+    note listing the questions asked in them. If the current turn alone is too
+    long, its function results are digested to share what is left of the
+    budget. The result only exceeds `budget` if the messages other than
+    function results do on their own.
+    """
+    messages = [dict(m) for m in messages]
+    current = max(
+        (i for i, m in enumerate(messages) if m.get("role") == "user"), default=0
+    )
+    for m in messages[:current]:
+        if m.get("role") in ("function", "tool") and m.get("content"):
+            m["content"] = digest_result(m["content"], FUNCTION_RESULT_TOKENS, model)
+
+    sizes = [message_tokens(m, model) for m in messages]
+    total = sum(sizes)
+    drop = 0
+    while drop < current and (
+        total > budget or messages[drop].get("role") == "tool"
+    ):
+        # Tool results are only valid after the message with their calls
+        total -= sizes[drop]
+        drop += 1
+    if drop:
+        messages = [_summary(messages[:drop])] + messages[drop:]
+        total += message_tokens(messages[0], model)
+        current = current - drop + 1
+
+    if total > budget:
+        results = [
+            m for m in messages[current:] if m.get("role") in ("function", "tool")
+        ]
+        others = total - sum(message_tokens(m, model) for m in results)
+        share = (budget - others) // max(len(results), 1) - 4 * MESSAGE_OVERHEAD
+        for m in results:
+            m["content"] = digest_result(m.get("content") or "", max(share, 0), model)
+    return messages
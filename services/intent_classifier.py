@@ -0,0 +1,70 @@
+import math
+import re
+from collections import Counter
+from zlib import crc32
+
+NGRAMS = (3, 4, 5)
+BUCKETS = 1 << 18
+URL_RE = re.compile(r"\b(?:https?://)?(?:[\w-]+\.)+[a-z]{2,}(?:/\S*)?", re.IGNORECASE)
+
+
+def normalize(text):
+    """Lowercase `text`, replace URLs and domains with `url` and squeeze spaces."""
+    text = URL_RE.sub(" url ", text.lower())
+    return " ".join(re.findall(r"\w+", text))
+
+
+def has_url(text):
+    """Return whether `text` mentions a URL or domain."""
+    return URL_RE.search(text) is not None
+
+
+def char_ngrams(text):
+    """Return the counts of hashed character n-grams of the normalized text."""
+    padded = f" {normalize(text)} "
+    return Counter(
+        crc32(padded[i : i + n].encode()) % BUCKETS
+        for n in NGRAMS
+        for i in range(len(padded) - n + 1)
+    )
+
+
+class LocalIntentClassifier:
+    """Offline intent classifier trained on the router utterances.
+
+    Texts become TF-IDF weighted vectors of hashed character n-grams, and a
+    query gets the route of its most similar utterance (cosine similarity),
+    which is also the confidence score. It needs no network and no model
+    download, so it can answer before the semantic router is ready.
+    """
+
+    def __init__(self, utterances):
+        """`utterances` maps each route name to its example utterances."""
+        docs = [
+            (name, char_ngrams(u)) for name, texts in utterances.items() for u in texts
+        ]
+        df = Counter(g for _, grams in docs for g in grams)
+        self.idf = {g: math.log((1 + len(docs)) / (1 + n)) + 1 for g, n in df.items()}
+        self.vectors = [(name, self._vector(grams)) for name, grams in docs]
+
+    def _vector(self, grams):
+        vec = {g: (1 + math.log(c)) * self.idf.get(g, 0.0) for g, c in grams.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {g: v / norm for g, v in vec.items() if v}
+
+    def predict(self, text):
+        """Return `(route name, confidence, margin)` for `text`.
+
+        The margin is how much more similar the best route is than the
+        runner-up, `(None, 0.0, 0.0)` is returned if nothing matches.
+        """
+        query = self._vector(char_ngrams(text))
+        scores = {}
+        for name, vec in self.vectors:
+            sim = sum(v * vec.get(g, 0.0) for g, v in query.items())
+            scores[name] = max(scores.get(name, 0.0), sim)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] <= 0:
+            return None, 0.0, 0.0
+        best, score = ranked[0]
+        return best, score, score - (ranked[1][1] if len(ranked) > 1 else 0.0)
@@ -1,8 +1,95 @@
 import json
 import os
+from itertools import chain
 from openai import OpenAI
+from types import SimpleNamespace
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
 from config.function_schemas import function_schemas
 from dotenv import load_dotenv
+from .context_manager import fit_messages
+from .completion_cache import (
+    COMPLETION_CACHE_SEMANTIC,
+    COMPLETION_CACHE_SIZE,
+    CompletionCache,
+)
+
+MODEL = "gpt-3.5-turbo"
+EMBEDDING_MODEL = os.getenv(
+    "COMPLETION_CACHE_EMBEDDING_MODEL", "text-embedding-3-small"
+)
+TOOLS = [{"type": "function", "function": schema} for schema in function_schemas]
+
+
+class StreamedMessage:
+    """A streamed chat completion message.
+
+    Iterating yields the content deltas as they arrive, e.g. for
+    `st.write_stream`, and accumulates them in `content`. Tool calls are
+    assembled from their streamed chunks into `tool_calls`. When they come
+    before any content, the constructor reads them all, so callers can branch
+    on them like on a full message; tool calls after preamble text are only
+    complete once the stream is exhausted, so check `tool_calls` again then.
+    `on_complete(message)` is called once the stream is exhausted.
+    """
+
+    def __init__(self, chunks, on_complete=None):
+        self.content = ""
+        self.tool_calls = None
+        self.on_complete = on_complete
+        self._deltas = (c.choices[0].delta for c in chunks if c.choices)
+        self._head = []
+        for delta in self._deltas:
+            self._head.append(delta)
+            if delta.content or delta.tool_calls:
+                break
+        if any(d.tool_calls for d in self._head):
+            for _ in self:
+                pass
+
+    def __iter__(self):
+        head, self._head = self._head, []
+        for delta in chain(head, self._deltas):
+            for part in delta.tool_calls or []:
+                # Parallel tool calls are interleaved by their `index`
+                if self.tool_calls is None:
+                    self.tool_calls = []
+                while len(self.tool_calls) <= part.index:
+                    self.tool_calls.append(
+                        ChatCompletionMessageToolCall(
+                            id="",
+                            type="function",
+                            function=Function(name="", arguments=""),
+                        )
+                    )
+                call = self.tool_calls[part.index]
+                call.id += part.id or ""
+                if part.function:
+                    call.function.name += part.function.name or ""
+                    call.function.arguments += part.function.arguments or ""
+            if delta.content:
+                self.content += delta.content
+                yield delta.content
+        if self.on_complete is not None:
+            self.on_complete(self)
+            self.on_complete = None
+
+    @classmethod
+    def from_message(cls, message):
+        """Replay a complete message, e.g. a cached one, as a stream."""
+        tool_calls = [
+            SimpleNamespace(index=i, id=call.id, function=call.function)
+            for i, call in enumerate(message.tool_calls or [])
+        ]
+        delta = SimpleNamespace(content=message.content, tool_calls=tool_calls)
+        return cls([SimpleNamespace(choices=[SimpleNamespace(delta=delta)])])
+
+    def to_message(self):
+        return ChatCompletionMessage(
+            role="assistant",
+            content=self.content or None,
+            tool_calls=self.tool_calls,
+        )
 
 
 class OpenAIService:
@@ -10,20 +97,54 @@ class OpenAIService:
         self.client = OpenAI(api_key=api_key)
         load_dotenv()
         self.system_prompt = os.getenv("SYSTEM_PROMPT")
+        self.cache = None
+        if COMPLETION_CACHE_SIZE > 0:
+            self.cache = CompletionCache(
+                embed=self.embed if COMPLETION_CACHE_SEMANTIC else None
+            )
+
+    def embed(self, text):
+        response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=[text])
+        return response.data[0].embedding
+
+    def _store(self, entry, message):
+        if message.content or message.tool_calls:
+            self.cache.store(entry, message.model_dump(exclude_none=True))
 
-    def get_completion(self, messages):
+    def get_completion(self, messages, stream=False):
 
-        # Prepend the system message to the conversation
+        # Fit the conversation in the context window and prepend the system message
+        messages = fit_messages(messages, model=MODEL)
         full_messages = [{"role": "system", "content": self.system_prompt}] + messages
 
+        entry = None
+        if self.cache is not None:
+            cached, entry = self.cache.lookup(
+                self.system_prompt, MODEL, TOOLS, messages
+            )
+            if cached is not None:
+                message = ChatCompletionMessage.model_validate(cached)
+                return StreamedMessage.from_message(message) if stream else message
+
         response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=MODEL,
             messages=full_messages,
-            functions=function_schemas,
-            function_call="auto",
+            tools=TOOLS,
+            tool_choice="auto",
+            parallel_tool_calls=True,
             temperature=0.7,
+            stream=stream,
         )
-        return response.choices[0].message
+        if stream:
+
+            def store(streamed):
+                self._store(entry, streamed.to_message())
+
+            return StreamedMessage(response, store if entry is not None else None)
+        message = response.choices[0].message
+        if entry is not None:
+            self._store(entry, message)
+        return message
 
     def get_function_args(self, function_call):
-        return json.loads(function_call.arguments)
+        return json.loads(function_call.arguments or "{}")
@@ -0,0 +1,48 @@
+import os
+from hashlib import sha1
+from typing import Any, List
+
+from pydantic import PrivateAttr
+from semantic_router.encoders import OpenAIEncoder
+
+from utils.cache import DiskCache, MemoryCache
+
+ROUTER_CACHE_DIR = os.getenv("ROUTER_CACHE_DIR", ".cache/router")
+QUERY_CACHE_SIZE = int(os.getenv("ROUTER_QUERY_CACHE_SIZE", "1024"))
+
+
+class CachedOpenAIEncoder(OpenAIEncoder):
+    """OpenAI encoder that only asks the API for embeddings it has not seen.
+
+    Embeddings of the route utterances are kept on disk under
+    `ROUTER_CACHE_DIR`, keyed by encoder model and utterance hash, so the
+    route layer is built without API calls after the first start. Other texts,
+    i.e. user queries, go to an in-memory LRU keyed by their normalized text.
+    """
+
+    _utterances: Any = PrivateAttr(default=None)
+    _disk: Any = PrivateAttr(default=None)
+    _queries: Any = PrivateAttr(default=None)
+
+    def __init__(self, utterances=(), cache_dir=ROUTER_CACHE_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self._utterances = set(utterances)
+        self._disk = DiskCache(cache_dir) if cache_dir else None
+        self._queries = MemoryCache(maxsize=QUERY_CACHE_SIZE)
+
+    def _cache(self, doc):
+        if doc in self._utterances and self._disk is not None:
+            return self._disk, (self.name, sha1(doc.encode()).hexdigest())
+        return self._queries, (self.name, " ".join(doc.lower().split()))
+
+    def __call__(self, docs: List[str], **kwargs) -> List[List[float]]:
+        keys = [self._cache(doc) for doc in docs]
+        embeds = [cache.get(key) for cache, key in keys]
+        missing = [i for i, e in enumerate(embeds) if e is None]
+        if missing:
+            new = super().__call__([docs[i] for i in missing], **kwargs)
+            for i, e in zip(missing, new):
+                cache, key = keys[i]
+                cache.set(key, e)
+                embeds[i] = e
+        return embeds
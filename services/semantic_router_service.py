@@ -1,80 +1,118 @@
 from dotenv import load_dotenv
-from semantic_router import Route, RouteLayer
-from semantic_router.encoders import OpenAIEncoder
 from config import router_schemas
+from .intent_classifier import LocalIntentClassifier, has_url
+import logging
 import os
+import threading
 
 load_dotenv()
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
 schemas = router_schemas
+LOCAL_INTENT_THRESHOLD = float(os.getenv("LOCAL_INTENT_THRESHOLD", "0.7"))
+LOCAL_INTENT_MARGIN = float(os.getenv("LOCAL_INTENT_MARGIN", "0.3"))
+WARMUP_INTENT_THRESHOLD = float(os.getenv("WARMUP_INTENT_THRESHOLD", "0.5"))
+WARMUP_INTENT_MARGIN = float(os.getenv("WARMUP_INTENT_MARGIN", "0.2"))
+
+logger = logging.getLogger(__name__)
 
 # Add the new route for trend analysis
-routes = [
-    Route(
-        name="fetch_cdx_data",
-        utterances=[
-            "Get CDX data for URL",
-            "Fetch Wayback Machine data for URL",
-            "Historical data for URL",
-            "Get historical data for URL",
-            "Get CDX data",
-            "Get Archive data",
-            "Get Archive records",
-        ],
-        function_schemas=schemas,
-    ),
-    Route(
-        name="get_trend_analysis",
-        utterances=[
-            "Analyze trends for URL",
-            "Get resilience, fixity, and chaos metrics",
-            "Trend analysis for website",
-            "Show me the trend analysis of URL",
-            "What are the trends for this URL?",
-            "What are the resilience, fixity, and chaos metrics for this URL?",
-            "What are the metrics for this URL?",
-            "What are the trends for this website?",
-            "How is this website doing?",
-            "How is this URL doing?",
-            "How has this URL been performing?",
-            "How healthy is this URL?",
-            "How resilient is this URL?",
-            "How chaotic is this URL?",
-            "How stable is this URL?",
-            "How reliable is this URL?",
-            "How trustworthy is this URL?",
-            "How secure is this URL?",
-            "How much has this URL changed?",
-            "How much has this website changed?",
-            "How much has this URL been modified?",
-        ],
-        function_schemas=schemas,
-    ),
-    Route(
-        name="fetch_data_wayback",
-        utterances=[
-            "Fetch webpage snapshot",
-            "Get webpage snapshot",
-            "Get webpage snapshot from Wayback Machine",
-            "Fetch webpage snapshot from Wayback Machine",
-            "Fetch webpage from Wayback Machine",
-            "What was the webpage like in the past?",
-            "Show me the webpage snapshot",
-            "What did the webpage look like in the past?",
-            "What was shown on the webpage in the past?",
-        ],
-        function_schemas=schemas,
-    ),
-]
+utterances = {
+    "fetch_cdx_data": [
+        "Get CDX data for URL",
+        "Fetch Wayback Machine data for URL",
+        "Historical data for URL",
+        "Get historical data for URL",
+        "Get CDX data",
+        "Get Archive data",
+        "Get Archive records",
+    ],
+    "get_trend_analysis": [
+        "Analyze trends for URL",
+        "Get resilience, fixity, and chaos metrics",
+        "Trend analysis for website",
+        "Show me the trend analysis of URL",
+        "What are the trends for this URL?",
+        "What are the resilience, fixity, and chaos metrics for this URL?",
+        "What are the metrics for this URL?",
+        "What are the trends for this website?",
+        "How is this website doing?",
+        "How is this URL doing?",
+        "How has this URL been performing?",
+        "How healthy is this URL?",
+        "How resilient is this URL?",
+        "How chaotic is this URL?",
+        "How stable is this URL?",
+        "How reliable is this URL?",
+        "How trustworthy is this URL?",
+        "How secure is this URL?",
+        "How much has this URL changed?",
+        "How much has this website changed?",
+        "How much has this URL been modified?",
+    ],
+    "fetch_data_wayback": [
+        "Fetch webpage snapshot",
+        "Get webpage snapshot",
+        "Get webpage snapshot from Wayback Machine",
+        "Fetch webpage snapshot from Wayback Machine",
+        "Fetch webpage from Wayback Machine",
+        "What was the webpage like in the past?",
+        "Show me the webpage snapshot",
+        "What did the webpage look like in the past?",
+        "What was shown on the webpage in the past?",
+    ],
+}
+
+
+def build_routes():
+    from semantic_router import Route
+
+    return [
+        Route(name=name, utterances=texts, function_schemas=schemas)
+        for name, texts in utterances.items()
+    ]
 
 
 class SemanticRouterService:
+    """Intent detection by a local classifier backed by a semantic router.
+
+    Building the route layer imports semantic_router and embeds every
+    utterance, so it runs in a background thread. Until the layer is ready,
+    or if building it failed, the local classifier answers on its own.
+    """
+
     def __init__(self):
-        encoder = OpenAIEncoder()
-        self.layer = RouteLayer(encoder=encoder, routes=routes)
+        self.classifier = LocalIntentClassifier(utterances)
+        self.layer = None
+        threading.Thread(
+            target=self._warm_up, name="router-warmup", daemon=True
+        ).start()
+
+    def _warm_up(self):
+        try:
+            from semantic_router import RouteLayer
+            from .router_encoder import CachedOpenAIEncoder
+
+            encoder = CachedOpenAIEncoder(
+                utterances=[u for texts in utterances.values() for u in texts]
+            )
+            self.layer = RouteLayer(encoder=encoder, routes=build_routes())
+        except Exception:
+            logger.exception("Semantic router warm-up failed")
 
     def get_intent(self, user_input):
+        # Every route is about a URL, so the local classifier only answers
+        # when one is mentioned and it clearly prefers one route
+        name, score, margin = self.classifier.predict(user_input)
+        local = name if has_url(user_input) else None
+        if local and score >= LOCAL_INTENT_THRESHOLD and margin >= LOCAL_INTENT_MARGIN:
+            return local
+
+        if self.layer is None:
+            # The router is not ready, so settle for a weaker local match
+            weak = score >= WARMUP_INTENT_THRESHOLD and margin >= WARMUP_INTENT_MARGIN
+            return local if weak else None
+
         result = self.layer(user_input)
 
         # If the confidence about a route is zero, return None
@@ -1,9 +1,10 @@
 from typing import Optional
 import logging
 from utils.fetch_data_wayback import fetch_data_wayback
-from utils.cdxdata import fetch_cdx_data
+from utils.cdxdata import fetch_cdx_batch, fetch_cdx_data
 from utils.extract_text import fetch_and_extract_text
-from utils.trend_analysis import get_trend_analysis
+from utils.snapshotbatch import fetch_snapshots, iter_snapshots, snapshot_jobs
+from utils.similarity import compare_captures, content_shifts
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,12 +15,33 @@ class WaybackService:
         logger.info(f"Fetching CDX data for URL: {url}")
         return fetch_cdx_data(url, limit=limit)
 
+    def fetch_cdx_batch(self, urls, limit=None, **params):
+        """Generator of per-URL CDX results for `urls`, in completion order."""
+        logger.info(f"Fetching CDX data for {len(urls)} URLs")
+        return fetch_cdx_batch(urls, limit=limit, **params)
+
     def fetch_and_extract_text(self, url):
         return fetch_and_extract_text(url)
 
     def get_trend_analysis(self, url):
+        # The trend engine needs pandas, so it is only imported when first used
+        from utils.trend_analysis import get_trend_analysis
+
         print("url", url)
         return get_trend_analysis(url)
 
     def fetch_data_wayback(self, url, time=None):
         return fetch_data_wayback(url, timestamp=time)
+
+    def iter_snapshots(self, urls, timestamps=None):
+        """Async generator of snapshots of `urls` at `timestamps`, in completion order."""
+        return iter_snapshots(snapshot_jobs(urls, timestamps))
+
+    def fetch_snapshots(self, urls, timestamps=None):
+        return fetch_snapshots(snapshot_jobs(urls, timestamps))
+
+    def compare_captures(self, url, a, b):
+        return compare_captures(url, a, b)
+
+    def content_shifts(self, url, top=5):
+        return content_shifts(url, top=top)
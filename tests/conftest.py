@@ -0,0 +1,42 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STATUSCODES = ["200", "200", "200", "301", "302", "404", "500", "503", "-"]
+
+
+def make_cdx_lines(seed, n, start="20200101", days=700):
+    """Generate `n` sorted `timestamp statuscode digest` CDX lines.
+
+    Captures cluster on few days so most days get several, digests repeat so
+    that `-` revisits resolve to an earlier status (or to none), and the
+    history ends well before today.
+    """
+    rng = np.random.default_rng(seed)
+    first = datetime.strptime(start, "%Y%m%d")
+    hot = rng.choice(days, size=max(days // 3, 1), replace=False)
+    offsets = np.sort(
+        np.where(
+            rng.random(n) < 0.7,
+            rng.choice(hot, size=n) * 86400 + rng.integers(0, 86400, n),
+            rng.integers(0, days * 86400, n),
+        )
+    )
+    digests = [f"{i:032d}".replace("0", "A") for i in range(max(n // 4, 1))]
+    lines = []
+    for off in offsets.tolist():
+        ts = (first + timedelta(seconds=int(off))).strftime("%Y%m%d%H%M%S")
+        status = STATUSCODES[rng.integers(len(STATUSCODES))]
+        digest = digests[rng.integers(len(digests))]
+        lines.append(f"{ts} {status} {digest}\n".encode())
+    return lines
+
+
+@pytest.fixture
+def cdx_lines():
+    return make_cdx_lines
@@ -0,0 +1,40 @@
+import pytest
+
+from utils.cdxengine import summarize_cdx_columns, summarize_cdx_lines
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("n", [1, 7, 300, 2500])
+def test_columnar_engine_matches_python_engine(cdx_lines, seed, n):
+    lines = cdx_lines(seed, n)
+    records, samples = summarize_cdx_lines(lines)
+    columnar_records, columnar_samples = summarize_cdx_columns(lines)
+    assert list(columnar_records) == list(records)
+    for day, record in records.items():
+        assert columnar_records[day] == record, day
+    assert columnar_samples == samples
+
+
+def test_revisits_take_the_status_of_their_digest():
+    lines = [
+        b"20200101000000 404 AAAA\n",
+        b"20200101000001 - AAAA\n",
+        b"20200102000000 - BBBB\n",
+        b"20200102000001 200 AAAA\n",
+        b"20200102000002 - AAAA\n",
+    ]
+    for summarize in (summarize_cdx_lines, summarize_cdx_columns):
+        records, _ = summarize(lines)
+        assert records["2020-01-01"].asdict()["_4xx"] == 2
+        assert records["2020-01-02"].asdict()["_2xx"] == 2
+        assert records["2020-01-02"].all == 2
+
+
+def test_chaos_window_beyond_1000_rows(cdx_lines):
+    lines = cdx_lines(7, 3000, days=20)
+    records, _ = summarize_cdx_lines(lines)
+    columnar, _ = summarize_cdx_columns(lines)
+    assert len(lines) > 1000
+    last = list(records)[-1]
+    assert columnar[last].chaosn == records[last].chaosn
+    assert records[last].chaosn != records[last].chaos
@@ -0,0 +1,143 @@
+from copy import deepcopy
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from utils.cache import MemoryCache
+from utils.cdxengine import DailyRecord, summarize_cdx_lines
+from utils.trendengine import (
+    SIGPARAMS,
+    STATUSES,
+    WBM,
+    build_trend_frames,
+    filler,
+    fillpolicies,
+    sigmoid,
+)
+
+URL = "example.com"
+
+
+def load_data(cdx, url, fill, policy, sigparams):
+    """The day-by-day loop `build_trend_frames` replaced, kept as reference."""
+    date_record, psc = deepcopy(cdx)
+    if fill != 0:
+        date_record.update(filler(date_record, fill, policy))
+    res = []
+    ps = "~"
+    pc = "Unknown"
+    pch = pchn = 0.0
+    base = basec = scale = scalec = h = hc = 0.5
+    x = xc = 0
+    for day in pd.date_range(next(iter(date_record)), pd.to_datetime("today")):
+        t = day.strftime("%Y-%m-%d")
+        dr = date_record.get(t, DailyRecord(t))
+        if dr.chaos:
+            pch = dr.chaos
+            pchn = dr.chaosn
+        else:
+            dr.chaos = pch
+            dr.chaosn = pchn
+        s = dr.specimen
+        p = sigparams.get(s)
+        if s != ps:
+            base = h
+            scale = base if p[2] < 0 else 1 - base
+            ps = s
+            x = 0
+        x += 1
+        h = base + scale * sigmoid(x, *p)
+        dr.resilience = h
+        c = dr.content
+        cp = sigparams.get(c)
+        if c != pc:
+            basec = hc
+            scalec = basec if cp[2] < 0 else 1 - basec
+            pc = c
+            xc = 0
+        xc += 1
+        hc = basec + scalec * sigmoid(xc, *cp)
+        dr.fixity = hc
+        res.append(dr)
+    resdf = pd.DataFrame([r.asdict() for r in res])
+    resdf.columns = [c[1:] if c[0] == "_" else c.title() for c in resdf.columns]
+    resdf["URIM"] = resdf["Datetime"].apply(
+        lambda x: f"{WBM}/{x}/{url}" if x != "~" else "#"
+    )
+    trs = {t: {s: 0 for s in STATUSES} for t in STATUSES}
+    rs = iter(res)
+    pr = next(rs)
+    for r in rs:
+        try:
+            trs[r.specimen][pr.specimen] += 1
+            pr = r
+        except KeyError:
+            continue
+    trsdf = (
+        pd.DataFrame(trs)
+        .reset_index()
+        .rename(columns={"index": "Source"})
+        .melt(
+            id_vars=["Source"],
+            value_vars=list(STATUSES),
+            var_name="Target",
+            value_name="Count",
+        )
+    )
+    return resdf, trsdf
+
+
+def assert_frames_equal(got, expected):
+    resdf, trsdf, _ = got
+    expected_resdf, expected_trsdf = expected
+    assert_frame_equal(resdf, expected_resdf)
+    assert_frame_equal(
+        trsdf.reset_index(drop=True),
+        expected_trsdf.reset_index(drop=True),
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("n", [1, 40, 1500])
+def test_vectorized_frames_match_loop(cdx_lines, seed, n):
+    cdx = summarize_cdx_lines(cdx_lines(seed, n))
+    assert_frames_equal(
+        build_trend_frames(cdx, URL, 0, "identical", SIGPARAMS),
+        load_data(cdx, URL, 0, "identical", SIGPARAMS),
+    )
+
+
+@pytest.mark.parametrize("policy", sorted(fillpolicies))
+@pytest.mark.parametrize("fill", [-1, 3])
+def test_fill_policies_match_loop(cdx_lines, policy, fill):
+    # Sparse captures leave gaps of all sizes to fill
+    cdx = summarize_cdx_lines(cdx_lines(3, 200, days=1400))
+    frames = build_trend_frames(cdx, URL, fill, policy, SIGPARAMS)
+    assert frames[0]["Filled"].any()
+    assert_frames_equal(frames, load_data(cdx, URL, fill, policy, SIGPARAMS))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_prefixes_match_full_build(cdx_lines, seed):
+    lines = cdx_lines(seed, 1200)
+    states = MemoryCache()
+    for end in [1, 2, 50, 51, 400, 401, 402, 900, 1200]:
+        cdx = summarize_cdx_lines(lines[:end])
+        assert_frames_equal(
+            build_trend_frames(cdx, URL, 0, "identical", SIGPARAMS, states),
+            load_data(cdx, URL, 0, "identical", SIGPARAMS),
+        )
+
+
+def test_backfilled_captures_force_a_recompute(cdx_lines):
+    lines = cdx_lines(11, 600)
+    states = MemoryCache()
+    build_trend_frames(
+        summarize_cdx_lines(lines[::2]), URL, 0, "identical", SIGPARAMS, states
+    )
+    cdx = summarize_cdx_lines(lines)
+    assert_frames_equal(
+        build_trend_frames(cdx, URL, 0, "identical", SIGPARAMS, states),
+        load_data(cdx, URL, 0, "identical", SIGPARAMS),
+    )
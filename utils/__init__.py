@@ -1,4 +1,33 @@
-from .cdxdata import fetch_cdx_data
-from .extract_text import fetch_and_extract_text
-from .trend_analysis import get_trend_analysis
-from .fetch_data_wayback import fetch_data_wayback
+import importlib
+import sys
+import types
+
+# The utilities pull in pandas, numpy, bs4 and mcmetadata, so they are
+# imported on first access rather than with the package.
+_exports = {
+    "fetch_cdx_data": ".cdxdata",
+    "fetch_and_extract_text": ".extract_text",
+    "get_trend_analysis": ".trend_analysis",
+    "fetch_data_wayback": ".fetch_data_wayback",
+}
+__all__ = list(_exports)
+
+
+class _Package(types.ModuleType):
+    # Importing a submodule binds its name on the package. Keep exports such
+    # as the `fetch_data_wayback` function bound to the function instead.
+    def __setattr__(self, name, value):
+        if name in _exports and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
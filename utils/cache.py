@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+
+
+class MemoryCache:
+    """Thread-safe in-memory cache with LRU eviction and an optional TTL.
+
+    Any object with the same `get(key)` / `set(key, value)` interface can be
+    passed to the engine functions instead, e.g. one backed by Redis or disk.
+    `get` returns None for missing or expired keys.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """JSON file per key under `root`, for values that should survive restarts.
+
+    Keys are hashed into a two-level directory layout; values must be JSON
+    serializable. Writes are atomic, so concurrent readers never see a partial
+    file, and every writing thread of every process sharing `root` uses its
+    own temporary file. With a `ttl` in seconds, entries older than that are treated as
+    missing.
+    """
+
+    def __init__(self, root, ttl=None):
+        self.root = root
+        self.ttl = ttl
+
+    def path(self, key):
+        h = sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.root, h[:2], f"{h}.json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as f:
+                item = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        expires = item.get("expires") if isinstance(item, dict) else None
+        if not isinstance(item, dict) or (expires is not None and expires < time.time()):
+            return None
+        return item.get("value")
+
+    def set(self, key, value):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with open(tmp, "w") as f:
+            json.dump({"value": value, "expires": expires}, f)
+        os.replace(tmp, path)
+
+
+class TieredCache:
+    """Memory cache in front of an optional slower tier such as `DiskCache`.
+
+    Hits in the slower tier are promoted to memory; writes go to both.
+    """
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
@@ -0,0 +1,104 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+from utils.cache import MemoryCache
+from utils.cdxcolumns import STATUSES, encode_status
+
+CAPTURE_INDEX_SIZE = int(os.getenv("CAPTURE_INDEX_SIZE", "16"))
+TSPAD = "19700101000000"
+OK = STATUSES.index("2xx")
+
+_indexes = MemoryCache(maxsize=CAPTURE_INDEX_SIZE)
+
+
+def _seconds(ts):
+    return datetime.strptime(str(ts), "%Y%m%d%H%M%S").timestamp()
+
+
+class CaptureIndex:
+    """Sorted capture timestamps of one URL with their status classes and digests.
+
+    Nearest-capture lookups bisect the int64 timestamps, either over all
+    captures or over the 2xx ones only. Runs of equal digests are located by
+    bisecting the digest change points, so skipping captures that share a
+    digest jumps over whole runs instead of scanning them.
+
+    `fingerprints` maps digests to SimHash fingerprints of the capture text,
+    filled by `utils.similarity` for the captures it samples and carried over
+    when the index of a URL is rebuilt.
+    """
+
+    def __init__(self, ts, status, digest):
+        order = np.argsort(ts, kind="stable")
+        self.ts = ts[order]
+        self.digest = digest[order]
+        self.codes, self.labels = encode_status(status[order], self.digest)
+        self.fingerprints = {}
+        self._views = {
+            False: self._view(None),
+            True: self._view(np.flatnonzero(self.codes == OK)),
+        }
+
+    def _view(self, pos):
+        ts = self.ts if pos is None else self.ts[pos]
+        dig = self.digest if pos is None else self.digest[pos]
+        return ts, pos, np.flatnonzero(dig[1:] != dig[:-1]) + 1
+
+    def _digest_at(self, pos, k):
+        return self.digest[k if pos is None else pos[k]]
+
+    def __len__(self):
+        return len(self.ts)
+
+    def capture(self, i):
+        return {
+            "timestamp": str(self.ts[i]),
+            "status": self.labels[self.codes[i]],
+            "digest": self.digest[i].decode(),
+        }
+
+    def nearest(self, timestamp, prefer_2xx=True, differ_from=None):
+        """Return the capture closest in time to `timestamp`, or None if there are none.
+
+        `timestamp` may be truncated, e.g. `"2010"` or `"201005"`. With
+        `prefer_2xx` only 2xx captures are considered, unless there are none.
+        `differ_from` is a digest whose captures are skipped, unless every
+        candidate has it.
+        """
+        t = int(str(timestamp) + TSPAD[len(str(timestamp)) :])
+        ts, pos, brk = self._views[bool(prefer_2xx and len(self._views[True][0]))]
+        n = len(ts)
+        if not n:
+            return None
+        i = int(np.searchsorted(ts, t))
+        left, right = i - 1, i
+        if differ_from is not None:
+            d = differ_from.encode() if isinstance(differ_from, str) else differ_from
+            while left >= 0 and self._digest_at(pos, left) == d:
+                r = int(np.searchsorted(brk, left, "right"))
+                left = int(brk[r - 1] if r else 0) - 1
+            while right < n and self._digest_at(pos, right) == d:
+                r = int(np.searchsorted(brk, right, "right"))
+                right = int(brk[r]) if r < len(brk) else n
+            if left < 0 and right >= n:
+                left, right = i - 1, i
+        cands = [k for k in (left, right) if 0 <= k < n]
+        target = _seconds(t)
+        k = min(cands, key=lambda k: abs(_seconds(ts[k]) - target))
+        return self.capture(k if pos is None else pos[k])
+
+
+def get_index(url):
+    """Return the cached `CaptureIndex` of `url`, or None if it is not loaded."""
+    return _indexes.get(url)
+
+
+def set_index(url, ts, status, digest):
+    index = CaptureIndex(ts, status, digest)
+    old = _indexes.get(url)
+    if old is not None:
+        index.fingerprints = old.fingerprints
+    _indexes.set(url, index)
+    return index
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from hashlib import sha1
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only threads are serialized
+    fcntl = None
+
+import numpy as np
+
+from utils.cdxcolumns import parse_cdx_lines
+
+COLUMNS = {"timestamp": np.int64, "statuscode": "S3", "digest": "S32"}
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _lock(path):
+    """Hold the lock of the URL directory `path` across threads and processes.
+
+    Trend workers and other app processes may share `CDX_STORE_DIR`, so a
+    thread lock is combined with an `flock` on a lock file in the directory.
+    """
+    with _locks_guard:
+        lock = _locks.setdefault(path, threading.Lock())
+    with lock:
+        os.makedirs(path, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(path, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def capture_lines(ts, status, digest):
+    """Yield stored captures as `timestamp statuscode digest` CDX lines."""
+    for t, s, d in zip(ts.tolist(), status.tolist(), digest.tolist()):
+        yield b"%d %s %s\n" % (t, s, d)
+
+
+class CaptureStore:
+    """On-disk store of raw `timestamp,statuscode,digest` captures per URL.
+
+    Each URL gets a directory with one fixed-width binary file per column and a
+    `state.json` that records how many rows are committed and where an
+    unfinished crawl has to resume. Rows past the committed count (left over
+    from an interrupted append) are ignored and overwritten on the next append.
+
+    A refresh only asks the CDX API for captures from the last stored timestamp
+    onwards. Captures indexed later with older timestamps are not picked up;
+    `clear` the URL to force a full crawl.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, url):
+        return os.path.join(self.root, sha1(url.encode()).hexdigest())
+
+    def state(self, url):
+        try:
+            with open(os.path.join(self.path(url), "state.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"url": url, "rows": 0, "last": None, "crawl": None}
+
+    def _save_state(self, url, state):
+        path = os.path.join(self.path(url), "state.json")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def load(self, url):
+        """Return the committed `(timestamps, statuscodes, digests)` columns."""
+        rows = self.state(url)["rows"]
+        path = self.path(url)
+        if not rows:
+            return tuple(np.zeros(0, dt) for dt in COLUMNS.values())
+        return tuple(
+            np.fromfile(os.path.join(path, col), dtype=dt, count=rows)
+            for col, dt in COLUMNS.items()
+        )
+
+    def _append(self, url, state, cols):
+        path = self.path(url)
+        for (col, dt), v in zip(COLUMNS.items(), cols):
+            with open(os.path.join(path, col), "r+b" if state["rows"] else "wb") as f:
+                f.seek(state["rows"] * np.dtype(dt).itemsize)
+                f.write(np.ascontiguousarray(v, dtype=dt).tobytes())
+                f.truncate()
+        state["rows"] += len(cols[0])
+        if len(cols[0]):
+            state["last"] = str(cols[0][-1])
+
+    def _tail(self, url, state, last):
+        """Return the `(statuscode, digest)` pairs stored at timestamp `last`."""
+        path = self.path(url)
+        ts = np.memmap(
+            os.path.join(path, "timestamp"), np.int64, "r", shape=(state["rows"],)
+        )
+        lo, hi = np.searchsorted(ts, [last, last + 1])
+        if lo == hi:
+            return set()
+        status = np.fromfile(
+            os.path.join(path, "statuscode"), "S3", count=hi - lo, offset=lo * 3
+        )
+        digest = np.fromfile(
+            os.path.join(path, "digest"), "S32", count=hi - lo, offset=lo * 32
+        )
+        return set(zip(status.tolist(), digest.tolist()))
+
+    def refresh(self, url, query, iter_pages, progress=None):
+        """Fetch captures newer than the stored ones and return all columns.
+
+        `query` is the CDX API query for `url` without a `from` parameter and
+        `iter_pages(query, start)` yields `(page, numpages, lines)` from page
+        `start`. Every page is committed as soon as it arrives, so a crawl that
+        fails on page N resumes from page N on the next refresh.
+        """
+        with _lock(self.path(url)):
+            state = self.state(url)
+            if state["crawl"] is None:
+                state["crawl"] = {"from": state["last"], "page": 0}
+                self._save_state(url, state)
+            crawl = state["crawl"]
+            last = tail = None
+            if crawl["from"]:
+                query = f"{query}&from={crawl['from']}"
+                last = int(crawl["from"])
+                tail = self._tail(url, state, last)
+            for page, maxp, lines in iter_pages(query, crawl["page"]):
+                cols = parse_cdx_lines(lines)
+                if last is not None:
+                    keep = cols[0] > last
+                    for i in np.flatnonzero(cols[0] == last):
+                        keep[i] = (cols[1][i][:3], cols[2][i]) not in tail
+                    cols = tuple(c[keep] for c in cols)
+                self._append(url, state, cols)
+                crawl["page"] = page + 1
+                self._save_state(url, state)
+                if progress:
+                    progress(min((page + 1) / maxp, 1.0))
+            state["crawl"] = None
+            self._save_state(url, state)
+            return self.load(url)
+
+    def clear(self, url):
+        with _lock(self.path(url)):
+            self._save_state(url, {"url": url, "rows": 0, "last": None, "crawl": None})
@@ -0,0 +1,131 @@
+import numpy as np
+
+STATUSES = ["~", "2xx", "3xx", "4xx", "5xx"]
+STPR = np.array([0, 4, 1, 3, 2], dtype=np.uint8)
+SWS = 1000
+PERIODS = {"Second": 14, "Minute": 12, "Hour": 10, "Day": 8, "Month": 6, "Year": 4}
+CHUNKLINES = 100000
+
+
+def _parse_chunk(chunk):
+    tokens = b"".join(chunk).split()
+    if len(tokens) % 3:
+        raise ValueError("Malformed CDX line, expected `timestamp statuscode digest`")
+    cols = np.array(tokens, dtype=bytes).reshape(-1, 3)
+    return cols[:, 0].astype(np.int64), cols[:, 1], cols[:, 2]
+
+
+def parse_cdx_lines(lines):
+    """Parse `timestamp statuscode digest` CDX lines into column arrays.
+
+    Lines are parsed in chunks so that only one chunk of Python objects is alive
+    at a time. Returns int64 timestamps and the raw status and digest byte arrays.
+    """
+    ts, status, digest = [], [], []
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CHUNKLINES:
+            for col, v in zip((ts, status, digest), _parse_chunk(chunk)):
+                col.append(v)
+            chunk = []
+    if chunk:
+        for col, v in zip((ts, status, digest), _parse_chunk(chunk)):
+            col.append(v)
+    if not ts:
+        return np.zeros(0, np.int64), np.zeros(0, "S3"), np.zeros(0, "S32")
+    return np.concatenate(ts), np.concatenate(status), np.concatenate(digest)
+
+
+def encode_status(status, digest):
+    """Encode raw status codes into uint8 status classes.
+
+    Codes index into the returned label list, which starts with `STATUSES`
+    followed by any unexpected raw status values. Revisit records (`-`) take
+    the status last seen for the same digest, or `~` if there is none.
+    """
+    n = len(status)
+    codes = np.zeros(n, dtype=np.uint8)
+    labels = list(STATUSES)
+    valid = (status >= b"200") & (status <= b"599")
+    codes[valid] = status[valid].astype("S1").view(np.uint8) - ord("1")
+    dash = status == b"-"
+    other = ~valid & ~dash
+    if other.any():
+        raw, inv = np.unique(status[other], return_inverse=True)
+        labels += [r.decode() for r in raw]
+        codes[other] = inv + len(STATUSES)
+    if dash.any():
+        _, did = np.unique(digest, return_inverse=True)
+        order = np.argsort(did, kind="stable")
+        sdid = did[order]
+        src = np.where(dash[order], -1, np.arange(n))
+        last = np.maximum.accumulate(src)
+        found = (last >= 0) & (sdid[np.maximum(last, 0)] == sdid)
+        scodes = codes[order]
+        resolved = np.where(found, scodes[np.maximum(last, 0)], 0)
+        codes[order] = np.where(dash[order], resolved, scodes)
+    return codes, labels
+
+
+def periodic_samples(ts):
+    if not len(ts):
+        return {p: 0 for p in PERIODS}
+    sample = {}
+    for p, v in PERIODS.items():
+        prefix = ts // 10 ** (14 - v)
+        sample[p] = 1 + int(np.count_nonzero(prefix[1:] != prefix[:-1]))
+    return sample
+
+
+def summarize_captures(ts, status, digest):
+    """Aggregate capture columns into per-day columns.
+
+    Days are consecutive runs of captures with the same date, as in the line
+    based `load_cdx` loop. Returns a dict of per-day arrays and the periodic
+    sample counts.
+    """
+    n = len(ts)
+    sample = periodic_samples(ts)
+    if not n:
+        return None, sample
+    codes, labels = encode_status(status, digest)
+    nc = len(labels)
+    day = ts // 1000000
+    first = np.ones(n, dtype=bool)
+    first[1:] = day[1:] != day[:-1]
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], n) - 1
+    run = np.cumsum(first) - 1
+    nruns = len(starts)
+
+    counts = np.bincount(run * nc + codes, minlength=nruns * nc).reshape(nruns, nc)
+
+    pr = STPR[np.minimum(codes, len(STPR) - 1)] * (codes < len(STPR))
+    runmax = np.maximum.reduceat(pr, starts)
+    cand = np.where(pr == runmax[run], np.arange(n), n)
+    spec = np.minimum.reduceat(cand, starts)
+
+    d8 = digest[spec].astype("S8")
+    prev = np.empty_like(d8)
+    prev[0] = b"~"
+    prev[1:] = d8[:-1]
+
+    ext = np.concatenate([np.zeros(SWS, dtype=codes.dtype), codes])
+    change = ext[1:] != ext[:-1]
+    cum = np.concatenate([[0], np.cumsum(change)])
+    rs = ends + 1
+    us = cum[ends + SWS] - cum[SWS - 1]
+    uw = cum[ends + SWS] - cum[ends + 1]
+
+    days = {
+        "day": day[starts],
+        "datetime": ts[spec],
+        "counts": counts[:, 1:5],
+        "specimen": np.array(labels, dtype=object)[codes[spec]],
+        "digest": d8,
+        "unchanged": d8 == prev,
+        "chaos": us / rs,
+        "chaosn": uw / np.minimum(SWS, rs),
+    }
+    return days, sample
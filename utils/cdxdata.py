@@ -1,6 +1,41 @@
+import os
 import requests
+from utils.httpclient import get_session
 import json
-from datetime import datetime, timezone
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+CDX_BATCH_CONCURRENCY = int(os.getenv("CDX_BATCH_CONCURRENCY", "8"))
+CDX_FIELDS = [
+    "urlkey",
+    "timestamp",
+    "original",
+    "mimetype",
+    "statuscode",
+    "digest",
+    "length",
+]
+
+# Shared by all batches, so concurrent batches together stay under the limit.
+_cdx_slots = threading.BoundedSemaphore(CDX_BATCH_CONCURRENCY)
+
+
+def _json_rows(lines):
+    """Yield the rows of a CDX `output=json` response, which has one row per line.
+
+    Empty rows, e.g. the whole body `[]` of a query without results, are skipped.
+    """
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if line.startswith("[["):
+            line = line[1:]
+        if line.endswith("]]"):
+            line = line[:-1]
+        if line:
+            row = json.loads(line)
+            if row:
+                yield row
 
 
 def fetch_cdx_data(
@@ -11,70 +46,140 @@ def fetch_cdx_data(
     filters=None,
     from_timestamp=None,
     to_timestamp=None,
+    collapse=None,
 ) -> str:
     """
     Fetches CDX (Capture Index) data from the Wayback Machine for a given URL.
 
     This function queries the Wayback Machine's CDX server to retrieve historical
-    information about captures of a specified URL. It allows for various query
-    parameters to filter and customize the results.
+    information about captures of a specified URL. Only captures with status code
+    200 are returned; that filter, the field projection and any collapsing are
+    applied by the CDX server, and the response is parsed line by line until
+    `limit` rows have been read.
 
     :param url: The URL to fetch CDX data for. This should be a full URL including
                 the protocol.
-    :return: A JSON string containing the CDX data if successful, or a dictionary
-             with an 'error' key describing the failure reason.
+    :param limit: The number of most recent captures to return. If None, the
+                  10 oldest captures are returned.
+    :param fields: The CDX fields to return, by default all of `CDX_FIELDS`.
+    :param filters: Additional CDX `filter` expressions.
+    :param collapse: A CDX `collapse` expression, e.g. "digest" or "timestamp:8".
+    :return: A JSON string containing the CDX rows (without a header) if
+             successful, or a dictionary with an 'error' key describing the
+             failure reason.
     """
     base_url = "http://web.archive.org/cdx/search/cdx"
-    print("d1")
-    if limit is not None:
-        params = {
-            "url": url,
-            "output": "json",
-            "limit": -limit,
-            "matchType": match_type,
-        }
-    else:
-        params = {"url": url, "output": "json", "limit": 10, "matchType": match_type}
-    print("d2")
-    if fields:
-        params["fl"] = ",".join(fields)
-    if filters:
-        params.update({"filter": filters})
+    fields = list(fields or CDX_FIELDS)
+    if isinstance(filters, str):
+        filters = [filters]
+    params = {
+        "url": url,
+        "output": "json",
+        # Without a limit the 10 oldest captures are returned, else the newest
+        "limit": 10 if limit is None else -limit,
+        "matchType": match_type,
+        "fl": ",".join(fields),
+        "filter": ["statuscode:200"] + list(filters or []),
+    }
+    if collapse:
+        params["collapse"] = collapse
     if from_timestamp:
         params["from"] = from_timestamp
     if to_timestamp:
         params["to"] = to_timestamp
-    print("d3")
-    # # Set from_timestamp to today's date if not provided
-    # if not from_timestamp:
-    #     today = datetime.now(timezone.utc).strftime("%Y%m%d")
-    #     params["from"] = today
     try:
-        response = requests.get(base_url, params=params)
-        print(response.json())
-        response.raise_for_status()
-        if response.status_code == 200:
-            cdx_data = response.json()
-            if cdx_data:
-                # Filter out captures with status code other than 200
-                filtered_cdx_data = [
-                    capture for capture in cdx_data if capture[4] == "200"
-                ]
-                if filtered_cdx_data:
-                    return json.dumps(filtered_cdx_data)
-                else:
-                    return {
-                        "error": "No CDX data found with status code 200 for this URL."
-                    }
-            else:
-                return {"error": "No CDX data found for this URL."}
-        else:
-            return {
-                "error": f"Failed to retrieve CDX data. Status code: {response.status_code}"
-            }
+        with get_session().get(base_url, params=params, stream=True) as response:
+            if response.status_code != 200:
+                return {
+                    "error": f"Failed to retrieve CDX data. Status code: {response.status_code}"
+                }
+            rows = []
+            for row in _json_rows(response.iter_lines(decode_unicode=True)):
+                if row == fields:
+                    continue
+                rows.append(row)
+                if len(rows) >= (limit or 10):
+                    break
+        if not rows:
+            return {"error": "No CDX data found with status code 200 for this URL."}
+        return json.dumps(rows)
 
     except requests.exceptions.RequestException as e:
         return {"error": str(e)}
+    except ValueError as e:
+        return {"error": f"Malformed CDX response: {e}"}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL the way the CDX server canonicalizes it for lookups.
+
+    The scheme, a leading `www.`, default ports, the fragment and a trailing
+    slash are dropped and the host is lowercased, so that e.g.
+    `https://WWW.Example.com/` and `example.com` give the same key.
+
+    :param url: The URL, with or without a scheme.
+    :return: The normalized URL.
+    """
+    url = url.strip()
+    parts = urlsplit(url if "://" in url else f"http://{url}")
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{parts.query}" if parts.query else f"{host}{path}"
+
+
+def _fetch_cdx_slot(url, params):
+    with _cdx_slots:
+        return fetch_cdx_data(url, **params)
+
+
+def fetch_cdx_batch(urls, concurrency=CDX_BATCH_CONCURRENCY, **params):
+    """
+    Fetches CDX data for many URLs concurrently and yields results as they finish.
+
+    URLs are normalized and deduplicated first. Queries run on a thread pool
+    under a process-wide limit of `CDX_BATCH_CONCURRENCY` concurrent requests.
+    A failing URL is reported in its own result and does not stop the batch.
+
+    :param urls: The URLs to fetch CDX data for.
+    :param concurrency: The number of worker threads of this batch.
+    :param params: Keyword arguments passed on to `fetch_cdx_data`.
+    :return: A generator of dicts with the normalized `url`, the `inputs` that
+             mapped to it and either the CDX `rows` or an `error` message.
+    """
+    inputs = {}
+    for url in urls:
+        inputs.setdefault(normalize_url(url), []).append(url)
+    inputs.pop("", None)
+    workers = max(min(concurrency, len(inputs)), 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_fetch_cdx_slot, url, params): url for url in inputs}
+        try:
+            for future in as_completed(futures):
+                url = futures[future]
+                result = {
+                    "url": url,
+                    "inputs": inputs[url],
+                    "rows": None,
+                    "error": None,
+                }
+                try:
+                    data = future.result()
+                except Exception as e:
+                    result["error"] = str(e)
+                else:
+                    if isinstance(data, dict):
+                        result["error"] = data.get("error")
+                    else:
+                        result["rows"] = json.loads(data)
+                yield result
+        finally:
+            for future in futures:
+                future.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,379 @@
+"""Streamlit-free CDX loading and per-day aggregation.
+
+Everything here runs outside a Streamlit script run, so it can be used from
+batch jobs and `ProcessPoolExecutor` workers. Progress is reported through an
+optional `progress(fraction)` callback and results can be kept in any cache
+with `get(key)` / `set(key, value)` methods, see `utils.cache.MemoryCache`.
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
+from utils.captureindex import get_index, set_index
+from utils.capturestore import CaptureStore, capture_lines
+from utils.httpclient import get_session
+from utils.cdxcolumns import parse_cdx_lines, summarize_captures
+
+CDXAPI = "https://web.archive.org/cdx/search/cdx"
+MAXCDXPAGES = 2000
+CDXWORKERS = int(os.getenv("CDX_WORKERS", "4"))
+CDXENGINE = os.getenv("CDX_ENGINE", "python")
+CDXSTORE = os.getenv("CDX_STORE_DIR")
+
+
+class DailyRecord:
+    """Per-day capture summary.
+
+    A slotted record whose `all` total and count based specimen are updated
+    by `incr` instead of being recomputed on every access. `FIELDS` lists the
+    public attributes in DataFrame column order, see `records_frame`.
+    """
+
+    FIELDS = (
+        "day",
+        "datetime",
+        "_2xx",
+        "_3xx",
+        "_4xx",
+        "_5xx",
+        "all",
+        "specimen",
+        "filled",
+        "resilience",
+        "digest",
+        "content",
+        "fixity",
+        "chaos",
+        "chaosn",
+    )
+    RANKS = {"2xx": 0, "4xx": 1, "5xx": 2, "3xx": 3, "~": 4}
+    __slots__ = (
+        "day",
+        "datetime",
+        "_2xx",
+        "_3xx",
+        "_4xx",
+        "_5xx",
+        "all",
+        "_specimen",
+        "_counted",
+        "resilience",
+        "digest",
+        "content",
+        "fixity",
+        "chaos",
+        "chaosn",
+    )
+
+    def __init__(
+        self,
+        day,
+        datetime="~",
+        _2xx=0,
+        _3xx=0,
+        _4xx=0,
+        _5xx=0,
+        specimen="~",
+        resilience=0.0,
+        digest="~",
+        content="Unknown",
+        fixity=0.0,
+        chaos=0.0,
+        chaosn=0.0,
+    ):
+        self.day = day
+        self.datetime = datetime
+        self._2xx = _2xx
+        self._3xx = _3xx
+        self._4xx = _4xx
+        self._5xx = _5xx
+        self.all = _2xx + _3xx + _4xx + _5xx
+        self.specimen = specimen
+        self._counted = next(
+            (k for k in ("2xx", "4xx", "5xx", "3xx") if getattr(self, "_" + k)), "~"
+        )
+        self.resilience = resilience
+        self.digest = digest
+        self.content = content
+        self.fixity = fixity
+        self.chaos = chaos
+        self.chaosn = chaosn
+
+    @property
+    def specimen(self) -> str:
+        if self._specimen != "~":
+            return self._specimen
+        return self._counted
+
+    @specimen.setter
+    def specimen(self, v):
+        self._specimen = v if isinstance(v, str) else "~"
+
+    @property
+    def filled(self) -> bool:
+        return self.specimen != "~" and not self.all
+
+    def incr(self, status, count=1):
+        rank = self.RANKS.get(status, 4)
+        if rank == 4:
+            return
+        k = "_" + status
+        setattr(self, k, getattr(self, k) + count)
+        self.all += count
+        if rank < self.RANKS[self._counted]:
+            self._counted = status
+
+    def astuple(self):
+        return tuple(getattr(self, k) for k in self.FIELDS)
+
+    def asdict(self):
+        return dict(zip(self.FIELDS, self.astuple()))
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return f"DailyRecord({', '.join(f'{k}={v!r}' for k, v in self.asdict().items())})"
+
+
+class PeriodicSamples:
+    PERIODS = {"Second": 14, "Minute": 12, "Hour": 10, "Day": 8, "Month": 6, "Year": 4}
+
+    def __init__(self):
+        self.count = 0
+        self.sample = {p: 0 for p in self.PERIODS}
+        self._prev = {p: "~" for p in self.PERIODS}
+
+    def __call__(self, dt):
+        self.count += 1
+        for k, v in self.PERIODS.items():
+            if dt[:v] == self._prev[k]:
+                break
+            self._prev[k] = dt[:v]
+            self.sample[k] += 1
+
+    def __str__(self):
+        return "\t".join([str(self.count)] + [str(v) for v in self.sample.values()])
+
+
+def _fetch_cdx_page(ses, url, page):
+    r = ses.get(f"{url}&page={page}")
+    if not r.ok:
+        raise ValueError(f"CDX API returned `{r.status_code}` status code for `{url}`")
+    return r.content.splitlines(keepends=True), int(r.headers.get("x-cdx-num-pages", 1))
+
+
+def iter_cdx_pages(url, workers=CDXWORKERS, start=0):
+    """Yield `(page, numpages, lines)` for the CDX pages of `url` in page order.
+
+    The page count is read from the first fetched page and the remaining pages
+    are fetched concurrently. At most `2 * workers` pages are held in memory at
+    any time while waiting for earlier pages to be yielded.
+    """
+    ses = get_session()
+    lines, maxp = _fetch_cdx_page(ses, url, start)
+    maxp = min(maxp, MAXCDXPAGES)
+    window = 2 * max(workers, 1)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+    try:
+        page = start + 1
+        while page < maxp and len(pending) < window:
+            pending.append(pool.submit(_fetch_cdx_page, ses, url, page))
+            page += 1
+        yield start, maxp, lines
+        done = start + 1
+        while pending:
+            lines, _ = pending.popleft().result()
+            if page < maxp:
+                pending.append(pool.submit(_fetch_cdx_page, ses, url, page))
+                page += 1
+            yield done, maxp, lines
+            done += 1
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_cdx_lines(url, workers=CDXWORKERS, progress=None):
+    """Yield CDX lines of all pages of `url` in page order.
+
+    With more than one worker, pages are fetched concurrently by
+    `iter_cdx_pages`; a single worker streams one page at a time.
+    """
+    if workers <= 1:
+        ses = get_session()
+        page = 0
+        while page < MAXCDXPAGES:
+            pageurl = f"{url}&page={page}"
+            r = ses.get(pageurl, stream=True)
+            if not r.ok:
+                raise ValueError(
+                    f"CDX API returned `{r.status_code}` status code for `{url}`"
+                )
+            r.raw.decode_content = True
+            for line in r.raw:
+                yield line
+            page += 1
+            maxp = int(r.headers.get("x-cdx-num-pages", 1))
+            if progress:
+                progress(min(page / maxp, 1.0))
+            if page >= maxp:
+                break
+        return
+    for page, maxp, lines in iter_cdx_pages(url, workers):
+        yield from lines
+        if progress:
+            progress(min((page + 1) / maxp, 1.0))
+
+
+def summarize_cdx_lines(lines):
+    digest_status = {}
+    date_record = {}
+    psc = PeriodicSamples()
+    STPR = {"2xx": 4, "4xx": 3, "5xx": 2, "3xx": 1}
+    SWS = 1000
+    sw = ["~"] * SWS
+    cp = -1
+    dr = None
+    pt = ""
+    pc = "~"
+    ps = "~"
+    rs = us = uw = 0
+    for l in lines:
+        ts, s, d = l.decode().split()
+        psc(ts)
+        t = f"{ts[:4]}-{ts[4:6]}-{ts[6:8]}"
+        s = f"{s[:1]}xx" if "200" <= s <= "599" else s
+        if s == "-":
+            s = digest_status.get(d, "~")
+        else:
+            digest_status[d] = s
+        d = d[:8]
+        if t != pt:
+            if pt:
+                pc = dr.digest
+                dr.chaos = us / rs
+                dr.chaosn = uw / min(SWS, rs)
+                date_record[pt] = dr
+            dr = DailyRecord(t)
+            cp = -1
+            pt = t
+        dr.incr(s)
+        pr = STPR.get(s, 0)
+        if pr > cp:
+            dr.specimen = s
+            dr.datetime = ts
+            dr.digest = d
+            dr.content = "Unchanged" if d == pc else "Changed"
+            cp = pr
+        wp = rs % SWS
+        rs += 1
+        if s != ps:
+            ps = s
+            us += 1
+            uw += 1
+        if sw[wp] != sw[wp - SWS + 1]:
+            uw -= 1
+        sw[wp] = s
+    if pt:
+        dr.chaos = us / rs
+        dr.chaosn = uw / min(SWS, rs)
+        date_record[pt] = dr
+    return (date_record, psc.sample)
+
+
+def summarize_cdx_captures(ts, status, digest):
+    days, sample = summarize_captures(ts, status, digest)
+    date_record = {}
+    if days is None:
+        return (date_record, sample)
+    for i, d in enumerate(days["day"].tolist()):
+        d = str(d)
+        t = f"{d[:4]}-{d[4:6]}-{d[6:8]}"
+        dr = DailyRecord(
+            t,
+            datetime=str(days["datetime"][i]),
+            _2xx=int(days["counts"][i, 0]),
+            _3xx=int(days["counts"][i, 1]),
+            _4xx=int(days["counts"][i, 2]),
+            _5xx=int(days["counts"][i, 3]),
+            specimen=days["specimen"][i],
+            digest=days["digest"][i].decode(),
+            content="Unchanged" if days["unchanged"][i] else "Changed",
+            chaos=float(days["chaos"][i]),
+            chaosn=float(days["chaosn"][i]),
+        )
+        date_record[t] = dr
+    return (date_record, sample)
+
+
+def summarize_cdx_columns(lines):
+    return summarize_cdx_captures(*parse_cdx_lines(lines))
+
+
+CDXENGINES = {"python": summarize_cdx_lines, "columnar": summarize_cdx_columns}
+
+
+def summarize_cdx(lines, engine=CDXENGINE):
+    return CDXENGINES[engine](lines)
+
+
+def cdx_query(url):
+    return f"{CDXAPI}?fl=timestamp,statuscode,digest&url={quote_plus(url)}"
+
+
+def load_stored_cdx(url, progress=None):
+    """Return the `(timestamps, statuscodes, digests)` columns of `url` from the store."""
+    return CaptureStore(CDXSTORE).refresh(
+        url,
+        cdx_query(url),
+        lambda query, start: iter_cdx_pages(query, CDXWORKERS, start),
+        progress,
+    )
+
+
+def load_captures(url, progress=None):
+    """Return the `(timestamps, statuscodes, digests)` columns of all captures of `url`.
+
+    Captures come from the on-disk store when `CDX_STORE_DIR` is set and from
+    the CDX API otherwise. The capture index of `url` is refreshed from them.
+    """
+    if CDXSTORE:
+        captures = load_stored_cdx(url, progress)
+    else:
+        captures = parse_cdx_lines(iter_cdx_lines(cdx_query(url), progress=progress))
+    set_index(url, *captures)
+    return captures
+
+
+def capture_index(url, progress=None):
+    """Return the `CaptureIndex` of `url`, loading its captures on first use."""
+    index = get_index(url)
+    if index is None:
+        load_captures(url, progress)
+        index = get_index(url)
+    return index
+
+
+def cdx_summary(url, engine=CDXENGINE, progress=None, cache=None):
+    """Return `(date_record, samples)` for `url`, the result of `load_cdx`.
+
+    The python engine streams the CDX lines, so its memory is bounded by the
+    page reorder window. No capture index is built here, see `capture_index`.
+    """
+    key = ("cdx", url, engine)
+    res = cache.get(key) if cache is not None else None
+    if res is None:
+        if CDXSTORE:
+            captures = load_stored_cdx(url, progress)
+            if engine == "columnar":
+                res = summarize_cdx_captures(*captures)
+            else:
+                res = summarize_cdx(capture_lines(*captures), engine)
+        else:
+            res = summarize_cdx(iter_cdx_lines(cdx_query(url), progress=progress), engine)
+        if cache is not None:
+            cache.set(key, res)
+    return res
@@ -1,7 +1,8 @@
 import requests
 import logging
-from mcmetadata import extract
 from typing import Optional
+from utils.htmlextract import extract_html
+from utils.httpclient import get_session
 
 # Configure logging
 logging.basicConfig(
@@ -13,8 +14,8 @@ def fetch_and_extract_text(url: str) -> Optional[str]:
     """
     Fetches a webpage and extracts its main textual content.
 
-    This function retrieves the HTML content of a given URL, then uses the
-    trafilatura library to extract relevant metadata and the main text content.
+    This function retrieves the HTML content of a given URL, then runs the
+    shared single-pass extraction (`utils.htmlextract`) in its "fast" profile.
     It focuses on extracting the title and the visible text content, discarding
     boilerplate elements like navigation, headers, footers, etc.
 
@@ -27,20 +28,14 @@ def fetch_and_extract_text(url: str) -> Optional[str]:
     """
     try:
         logging.info(f"Fetching content from {url}")
-        response = requests.get(url)
+        response = get_session().get(url)
         response.raise_for_status()
 
-        encoding = response.encoding if response.encoding else "utf-8"
-        html_content = response.content.decode(encoding)
         logging.info(f"Extracting metadata from {url}")
-        metadata = extract(url=url, html_text=html_content)
-
-        # Extract relevant metadata
-        title = metadata.get("normalized_article_title", "")
-        visible_text = metadata.get("text_content", "")
+        page = extract_html(url, response.content, profile="fast")
 
         # Concatenate all parts with newline separators
-        text_content = "\n".join([title, visible_text])
+        text_content = "\n".join([page["title"], page["text"]])
         logging.info(f"Successfully extracted text content from {url}")
         return text_content.strip()
     except requests.RequestException as e:
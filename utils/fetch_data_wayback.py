@@ -1,123 +1,185 @@
-from datetime import datetime, timedelta
 import logging
 import streamlit as st
 import streamlit.components.v1 as components
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
 import requests
-from mcmetadata import extract
 import json
+import os
+from utils.cache import DiskCache, MemoryCache, TieredCache
 from utils.cdxdata import fetch_cdx_data
-from typing import Optional, Dict, Any
+from utils.captureindex import get_index
+from utils.htmlextract import extract_html, html_prefix, stream_text
+from utils.httpclient import get_session
+from typing import Iterator, Optional, Tuple
 from functools import lru_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CDXAPI = "https://web.archive.org/cdx/search/cdx"
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", "1024"))
+SNAPSHOT_CACHE_DIR = os.getenv("SNAPSHOT_CACHE_DIR")
+SNAPSHOT_MAX_BYTES = int(os.getenv("SNAPSHOT_MAX_BYTES", str(5 << 20)))
+SNAPSHOT_PROFILE = os.getenv("SNAPSHOT_PROFILE", "fast")
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+CHUNK_SIZE = 64 << 10
+
+# Extracted snapshot text keyed by CDX content digest. Byte-identical captures
+# share a digest, so any of them can be served without fetching or parsing.
+snapshot_texts = TieredCache(
+    MemoryCache(maxsize=SNAPSHOT_CACHE_SIZE),
+    DiskCache(SNAPSHOT_CACHE_DIR) if SNAPSHOT_CACHE_DIR else None,
+)
+
 
 @lru_cache(maxsize=100)
-def get_latest_timestamp(url: str) -> str:
+def get_latest_capture(url: str) -> Tuple[str, str]:
     """
-    Fetches the latest snapshot timestamp for a given URL.
+    Fetches the latest snapshot timestamp and content digest for a given URL.
 
-    :param url: The URL to fetch the timestamp for.
-    :return: The latest snapshot timestamp.
+    :param url: The URL to fetch the capture for.
+    :return: The latest snapshot timestamp and its digest.
     :raises ValueError: If no snapshot data is available.
     """
-    cdx_data = fetch_cdx_data(url=url, limit=100)
-    cdx_json = json.loads(cdx_data)
-
-    if isinstance(cdx_json, dict) and "error" in cdx_json:
-        raise ValueError(f"Error fetching CDX data: {cdx_json['error']}")
-    if len(cdx_json) < 2:
-        raise ValueError("No snapshot data available for this URL")
+    cdx_data = fetch_cdx_data(
+        url=url, match_type="exact", limit=1, fields=["timestamp", "digest"]
+    )
+    if isinstance(cdx_data, dict):
+        raise ValueError(f"Error fetching CDX data: {cdx_data['error']}")
 
-    return cdx_json[1][1]
+    timestamp, digest = json.loads(cdx_data)[-1]
+    return timestamp, digest
 
 
-def fetch_wayback_content(wayback_url: str) -> str:
+def open_wayback_content(wayback_url: str) -> requests.Response:
     """
-    Fetches content from a Wayback Machine URL.
+    Starts a streamed fetch of a Wayback Machine URL.
+
+    Only the headers are read, so non-HTML resources are rejected before any
+    of the body is downloaded.
 
     :param wayback_url: The Wayback Machine URL to fetch.
-    :return: The fetched HTML content.
+    :return: The streamed response.
     :raises requests.RequestException: If there's an error fetching the content.
+    :raises ValueError: If the content is not HTML.
     """
-    response = urlopen(wayback_url)
-    if response.status != 200:
+    response = get_session().get(wayback_url, stream=True)
+    if response.status_code != 200:
+        response.close()
         raise requests.RequestException(
-            f"HTTP Error {response.status}: {response.reason}"
+            f"HTTP Error {response.status_code}: {response.reason}"
         )
-    return response.read()
+    ctype = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if ctype and ctype not in HTML_TYPES:
+        response.close()
+        raise ValueError(f"Not an HTML page: {ctype}")
+    return response
 
 
-def clean_text(text: str) -> str:
+def iter_wayback_content(
+    response: requests.Response, max_bytes: int = SNAPSHOT_MAX_BYTES
+) -> Iterator[bytes]:
     """
-    Cleans up extracted text.
+    Yields the body of a streamed response in chunks, up to `max_bytes`.
 
-    :param text: The text to clean.
-    :return: Cleaned text.
+    :param response: A response from `open_wayback_content`.
+    :param max_bytes: The maximum number of (decompressed) bytes to read.
+    :raises ValueError: If the body looks binary.
     """
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    return "\n".join(chunk for chunk in chunks if chunk)
-
-
-def extract_metadata(url: str, text: str) -> Dict[str, Any]:
+    received = 0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if not received and b"\0" in chunk[:1024]:
+                raise ValueError("Not an HTML page: binary content")
+            chunk = chunk[: max_bytes - received]
+            received += len(chunk)
+            yield chunk
+            if received >= max_bytes:
+                logger.info(f"Truncated {response.url} at {max_bytes} bytes")
+                break
+    finally:
+        response.close()
+
+
+def fetch_wayback_content(
+    wayback_url: str, max_bytes: int = SNAPSHOT_MAX_BYTES
+) -> bytes:
     """
-    Extracts metadata from the given text using mcmetadata.
+    Fetches content from a Wayback Machine URL.
 
-    :param url: The URL of the webpage.
-    :param text: The text content to extract metadata from.
-    :return: A dictionary containing the extracted metadata.
+    :param wayback_url: The Wayback Machine URL to fetch.
+    :param max_bytes: The maximum number of bytes to read.
+    :return: The fetched HTML content, truncated to `max_bytes`.
+    :raises requests.RequestException: If there's an error fetching the content.
+    :raises ValueError: If the content is not HTML.
     """
-    metadata = extract(url=url, html_text=text)
-    return {
-        "title": metadata.get("normalized_article_title", ""),
-        "visible_text": metadata.get("text_content", ""),
-    }
+    return b"".join(iter_wayback_content(open_wayback_content(wayback_url), max_bytes))
 
 
-@st.cache_data(max_entries=100, show_spinner=False)
-def get_snapshot_within_month(url: str, target_timestamp: str) -> str:
+def snapshot_text(url: str, wayback_url: str, profile: str = SNAPSHOT_PROFILE) -> str:
     """
-    Fetches a snapshot timestamp within one month of the target timestamp.
+    Fetches a snapshot and extracts its title and main text.
 
-    :param url: The URL to fetch the timestamp for.
-    :param target_timestamp: The target timestamp in "YYYYMMDDhhmmss" format.
-    :return: The closest snapshot timestamp within one month.
-    :raises ValueError: If no snapshot data is available.
-    """
-    target_date = datetime.strptime(target_timestamp, "%Y%m%d%H%M%S")
-    from_date = (target_date - timedelta(days=15)).strftime("%Y%m%d%H%M%S")
-    to_date = (target_date + timedelta(days=15)).strftime("%Y%m%d%H%M%S")
-    logger.info(f"Fetching snapshots between {from_date} and {to_date}...")
+    The body is parsed while it streams in and reading stops once it holds
+    `SNAPSHOT_TEXT_CHARS` characters of visible text. The "text" profile returns that
+    text; the others hand the HTML read so far to the extractors, so text
+    beyond the budget on very long pages is not extracted.
 
-    cdx_data = fetch_cdx_data(
-        url=url, limit=100, from_timestamp=from_date, to_timestamp=to_date
-    )
-    # cdx_json = json.loads(cdx_data)
+    :param url: The original URL of the snapshot.
+    :param wayback_url: The Wayback Machine URL to fetch.
+    :param profile: The extraction profile, see `utils.htmlextract`.
+    :return: The title and visible text joined by a newline.
+    :raises requests.RequestException: If there's an error fetching the content.
+    :raises ValueError: If the content is not HTML or is too short.
+    """
+    response = open_wayback_content(wayback_url)
+    chunks = iter_wayback_content(response)
+    has_charset = "charset" in response.headers.get("Content-Type", "").lower()
+    encoding = response.encoding if has_charset else "utf-8"
+    try:
+        if profile == "text":
+            page = stream_text(chunks, encoding)
+        else:
+            page = extract_html(url, html_prefix(chunks, encoding), profile)
+    finally:
+        chunks.close()
+    text_content = "\n".join([page["title"], page["text"]])
+    logger.debug(f"Extracted text length: {len(text_content)} characters")
 
-    if isinstance(cdx_data, dict) and "error" in cdx_data:
-        raise ValueError(f"Error fetching CDX data: {cdx_data['error']}")
+    if len(text_content.strip()) < 50:
+        raise ValueError("Content is too short")
 
-    if not cdx_data:
-        raise ValueError("No snapshot data available for this URL")
+    return text_content.strip()
 
-    cdx_json = json.loads(cdx_data)
 
-    if isinstance(cdx_json, dict) and "error" in cdx_json:
-        raise ValueError(f"Error fetching CDX data: {cdx_json['error']}")
-    if len(cdx_json) < 2:
-        raise ValueError("No snapshot data available for this URL")
+def closest_capture(url: str, timestamp: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Finds the 200 capture of a URL closest to a timestamp.
 
-    # Find the closest timestamp to the target
-    closest_snapshot = min(
-        cdx_json,
-        key=lambda x: abs(datetime.strptime(x[1], "%Y%m%d%H%M%S") - target_date),
-    )
+    A capture index that is already loaded for the URL answers without a
+    network request; otherwise a single CDX `closest` query with `limit=1` is
+    made, so the URL's capture history is never loaded just for this lookup.
 
-    return closest_snapshot[1]
+    :param url: The URL to find the capture for.
+    :param timestamp: The target timestamp, possibly truncated, e.g. "2010".
+                      If None, the latest capture is returned.
+    :return: The closest snapshot timestamp and its digest.
+    :raises ValueError: If no snapshot data is available.
+    """
+    index = get_index(url)
+    if index is not None and len(index):
+        capture = index.nearest(timestamp or "99991231235959")
+        return capture["timestamp"], capture["digest"]
+    params = {"url": url, "fl": "timestamp,digest", "filter": "statuscode:200"}
+    if timestamp:
+        params.update({"closest": timestamp, "sort": "closest", "limit": 1})
+    else:
+        params["limit"] = -1
+    res = get_session().get(CDXAPI, params=params)
+    res.raise_for_status()
+    fields = res.text.split()
+    if len(fields) < 2:
+        raise ValueError(f"No snapshot data available for {url}")
+    return fields[0], fields[1]
 
 
 def fetch_data_wayback(
@@ -138,9 +200,9 @@ def fetch_data_wayback(
         logger.info(f"Fetching content for the time: {timestamp}")
 
         if timestamp:
-            timestamp = get_snapshot_within_month(url, timestamp)
+            timestamp, digest = closest_capture(url, timestamp)
         else:
-            timestamp = get_latest_timestamp(url)
+            timestamp, digest = get_latest_capture(url)
 
         logger.info(f"Using snapshot timestamp: {timestamp}")
         if debug:
@@ -154,33 +216,19 @@ def fetch_data_wayback(
             st.write("Here's the Wayback Machine rendering of the page:")
             components.iframe(wayback_url, width=700, height=500, scrolling=True)
 
-        logger.info(f"Fetching html content from: {wayback_url}")
-
-        html = fetch_wayback_content(wayback_url)
-        soup = BeautifulSoup(html, features="html.parser")
-        for script in soup(["script", "style"]):
-            script.extract()
+        text = snapshot_texts.get(digest)
+        if text is not None:
+            logger.info(f"Using cached text for digest: {digest}")
+            return text
 
-        text = clean_text(soup.get_text())
-
-        if debug:
-            logger.debug(f"Extracted text length: {len(text)} characters")
-
-        metadata = extract_metadata(url, text)
-
-        text_content = "\n".join([metadata["title"], metadata["visible_text"]])
-
-        if len(text_content.strip()) < 50:
-            raise ValueError("Content is too short")
+        logger.info(f"Fetching html content from: {wayback_url}")
 
-        return text_content.strip()
+        text = snapshot_text(url, wayback_url)
+        snapshot_texts.set(digest, text)
+        return text
 
     except (requests.RequestException, ValueError) as e:
         logger.error(f"Error processing {url}: {e}")
-        if debug and "text" in locals():
-            logger.debug(
-                f"Extracted text: {text[:500]}..."
-            )  # Print first 500 characters
         return ""
     except Exception as e:
         logger.error(f"Unexpected error processing {url}: {e}")
@@ -0,0 +1,236 @@
+"""Single-pass extraction of the title and text of an HTML page.
+
+The raw HTML is handed to `mcmetadata.extract` once. The "fast" profile passes
+overrides so that publication date guessing and language detection are skipped,
+"full" runs every step. When none of the mcmetadata extractors find enough
+content, e.g. on homepages, the visible text is taken from a single parse with
+lxml (or `html.parser` if lxml is not installed).
+
+Extraction is CPU bound, so `extract_html` runs it in a shared process pool of
+`EXTRACT_PROCESSES` workers; set it to 0 to extract in the calling process.
+The workers are started with forkserver (spawn where that is unavailable),
+as forking the threaded Streamlit server can deadlock them.
+
+`stream_text` is the lightweight alternative for when only the visible text is
+needed: it feeds HTML chunks to an incremental `html.parser` as they arrive and
+stops as soon as `TEXT_BUDGET` characters are collected, so the whole document
+is never held in memory. `html_prefix` applies the same budget before the
+extractors run, reading a page only until it holds that much visible text.
+"""
+
+import codecs
+import importlib.util
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", "2"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "60"))
+# Forking a multi-threaded server can deadlock the child, so never fork
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+TEXT_BUDGET = int(os.getenv("SNAPSHOT_TEXT_CHARS", "20000"))
+PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+PROFILES = {
+    "fast": {"publication_date": None, "language": None},
+    "full": {},
+}
+
+logger = logging.getLogger(__name__)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def clean_text(text: str) -> str:
+    """
+    Cleans up extracted text.
+
+    :param text: The text to clean.
+    :return: Cleaned text.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return "\n".join(chunk for chunk in chunks if chunk)
+
+
+def visible_text(html: str):
+    """Return the `<title>` and the visible text of `html` from one parse."""
+    soup = BeautifulSoup(html, features=PARSER)
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    title = soup.title.get_text(" ", strip=True) if soup.title else ""
+    return title, clean_text((soup.body or soup).get_text("\n"))
+
+
+class TextCollector(HTMLParser):
+    """Incremental parser that collects the title and visible text of a page.
+
+    `done` is set once `max_chars` characters of text have been collected;
+    callers should stop feeding it then.
+    """
+
+    SKIP = {"script", "style", "noscript", "template"}
+
+    def __init__(self, max_chars=TEXT_BUDGET):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = []
+        self.parts = []
+        self.size = 0
+        self.done = False
+        self._skip = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(self._skip - 1, 0)
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title.append(data)
+        elif not self._skip and not self.done:
+            self.parts.append(data)
+            self.size += len(data)
+            self.done = self.size >= self.max_chars
+
+
+def _decoder(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def html_prefix(chunks, encoding="utf-8", max_chars=TEXT_BUDGET) -> bytes:
+    """
+    Reads HTML byte chunks until they hold `max_chars` characters of visible text.
+
+    The chunks are parsed incrementally to count the text, so a long page is
+    only downloaded as far as the extractors need it.
+
+    :param chunks: The HTML as an iterable of bytes.
+    :param encoding: The character encoding of the HTML.
+    :param max_chars: The text budget.
+    :return: The HTML bytes read.
+    """
+    decoder = _decoder(encoding)
+    parser = TextCollector(max_chars)
+    body = []
+    for chunk in chunks:
+        body.append(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    return b"".join(body)
+
+
+def stream_text(chunks, encoding="utf-8", max_chars=TEXT_BUDGET) -> dict:
+    """
+    Collects the title and visible text from an iterable of HTML byte chunks.
+
+    Chunks are decoded and parsed incrementally, and no more chunks are read
+    once `max_chars` characters of text have been collected.
+
+    :param chunks: The HTML as an iterable of bytes.
+    :param encoding: The character encoding of the HTML.
+    :param max_chars: The text budget.
+    :return: A dict with `title` and `text`.
+    """
+    decoder = _decoder(encoding)
+    parser = TextCollector(max_chars)
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    else:
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+    title = " ".join("".join(parser.title).split())
+    return {"title": title, "text": clean_text("\n".join(parser.parts))[:max_chars]}
+
+
+def extract_page(url: str, html, profile: str = "fast") -> dict:
+    """
+    Extracts the title and main text of a page in the current process.
+
+    :param url: The URL the HTML was fetched from.
+    :param html: The HTML as text or raw bytes.
+    :param profile: "fast" or "full", see `PROFILES`, or "text" for `stream_text`.
+    :return: A dict with `title` and `text`.
+    """
+    if profile == "text":
+        return stream_text([html.encode() if isinstance(html, str) else html])
+    # mcmetadata loads its language and date models on import, so defer it to first use
+    from mcmetadata import extract
+    from mcmetadata.exceptions import BadContentError, UnableToExtractError
+
+    if isinstance(html, bytes):
+        html = UnicodeDammit(html, is_html=True).unicode_markup or ""
+    try:
+        metadata = extract(url=url, html_text=html, overrides=PROFILES[profile])
+        title = metadata.get("normalized_article_title") or ""
+        text = metadata.get("text_content") or ""
+    except (UnableToExtractError, BadContentError):
+        title = text = ""
+    if not text.strip():
+        fallback, text = visible_text(html)
+        title = title or fallback
+    return {"title": title, "text": text}
+
+
+def extract_pool():
+    """Return the shared extraction process pool, or None if it is disabled."""
+    global _pool
+    if EXTRACT_PROCESSES > 0 and _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=EXTRACT_PROCESSES,
+                    mp_context=multiprocessing.get_context(START_METHOD),
+                )
+    return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_html(url: str, html, profile: str = "fast") -> dict:
+    """Run `extract_page` in the shared process pool and wait for the result.
+
+    If a worker died, e.g. out of memory on a huge page, the pool is replaced
+    and the page is tried once more in the new pool. Waiting stops after
+    `EXTRACT_TIMEOUT` seconds with a `concurrent.futures.TimeoutError`.
+    """
+    for attempt in range(2):
+        pool = extract_pool()
+        if pool is None:
+            return extract_page(url, html, profile)
+        try:
+            return pool.submit(extract_page, url, html, profile).result(
+                timeout=EXTRACT_TIMEOUT
+            )
+        except BrokenProcessPool:
+            logger.warning("Extraction pool broke, starting a new one")
+            _reset_pool(pool)
+            if attempt:
+                raise
@@ -0,0 +1,74 @@
+import os
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+POOLSIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+RETRYSTATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class JitterRetry(Retry):
+    """Retry policy whose exponential backoff is spread by random jitter.
+
+    A `Retry-After` header on 429/503 responses takes precedence over the
+    backoff, as urllib3 sleeps for that value instead.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff * random.uniform(0.5, 1.5) if backoff else backoff
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that applies a default `(connect, read)` timeout."""
+
+    def __init__(self, *args, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def new_session(retries=RETRIES, poolsize=POOLSIZE):
+    retry = JitterRetry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRYSTATUS,
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        max_retries=retry, pool_connections=poolsize, pool_maxsize=poolsize
+    )
+    ses = requests.Session()
+    ses.headers["Accept-Encoding"] = "gzip, deflate"
+    ses.mount("http://", adapter)
+    ses.mount("https://", adapter)
+    return ses
+
+
+def get_session():
+    """Return the process-wide session shared by all Wayback and CDX calls.
+
+    It keeps per-host keep-alive connection pools, asks for gzip, applies
+    connect/read timeouts and retries 429/5xx responses with jittered backoff.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = new_session()
+    return _session
@@ -0,0 +1,103 @@
+"""Import-time profile of the app's modules.
+
+Each module is imported in a fresh interpreter under `python -X importtime`
+and the report lists the total import time, the most expensive top-level
+packages (by their own import time, summed) and the slowest single imports
+(by cumulative time)::
+
+    python -m utils.importprofile
+    python -m utils.importprofile services.openai_service --top 20
+
+Run it from the repository root, so the app packages are importable.
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from collections import Counter
+
+# What the app imports while it runs; the `services` and `utils` packages
+# themselves are lazy and cost next to nothing.
+MODULES = [
+    "services.openai_service",
+    "services.wayback_service",
+    "services.semantic_router_service",
+    "utils.trend_analysis",
+]
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def import_times(module):
+    """Import `module` in a new interpreter and return its importtime rows.
+
+    :param module: The dotted module name to import.
+    :return: A list of `(name, self_us, cumulative_us, depth)` tuples in the
+             order Python reports them, i.e. children before their parent.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((name, int(own), int(cumulative), len(indent) // 2))
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return rows
+
+
+def subtree(module, rows):
+    """Return the rows of the imports made by importing `module` itself.
+
+    Interpreter start-up, e.g. `site`, is reported first and left out.
+    """
+    for end in range(len(rows) - 1, -1, -1):
+        if rows[end][0] == module and rows[end][3] == 0:
+            break
+    else:
+        return rows
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    return rows[start : end + 1]
+
+
+def summarize(module, rows, top=10):
+    """Return a text report of the importtime `rows` of `module`."""
+    rows = subtree(module, rows)
+    total = sum(own for _, own, _, _ in rows)
+    packages = Counter()
+    for name, own, _, _ in rows:
+        packages[name.split(".")[0]] += own
+    slowest = sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+
+    lines = [f"import {module}: {total / 1000:.1f} ms, {len(rows)} modules"]
+    lines.append("  top-level packages by own time:")
+    for name, own in packages.most_common(top):
+        lines.append(f"    {own / 1000:9.1f} ms  {name}")
+    lines.append("  imports by cumulative time:")
+    for name, _, cumulative, _ in slowest:
+        lines.append(f"    {cumulative / 1000:9.1f} ms  {name}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+    for module in args.modules:
+        try:
+            print(summarize(module, import_times(module), args.top))
+        except RuntimeError as e:
+            print(f"import {module}: failed: {e}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""SimHash fingerprints of capture text for content similarity over time.
+
+Fingerprints are 64-bit SimHashes of word shingles of the extracted text.
+They are kept per digest in the `CaptureIndex` of the URL and, with
+`FINGERPRINT_CACHE_DIR` set (by default a `fingerprints` directory in
+`CDX_STORE_DIR`), on disk, so each distinct capture is fetched and hashed at
+most once across index rebuilds and restarts. Comparing two captures is a
+Hamming distance between two integers::
+
+    compare_captures("example.com", "2010", "2020")["similarity"]
+    content_shifts("example.com", samples=24, top=3)
+"""
+
+import os
+import re
+from hashlib import blake2b
+
+import numpy as np
+
+from utils.cache import DiskCache
+from utils.captureindex import OK
+from utils.cdxengine import CDXSTORE, capture_index
+from utils.snapshotbatch import fetch_snapshots
+
+SIMHASH_BITS = 64
+SHINGLE = 3
+SAMPLES = int(os.getenv("SIMILARITY_SAMPLES", "12"))
+FINGERPRINT_CACHE_DIR = os.getenv(
+    "FINGERPRINT_CACHE_DIR", CDXSTORE and os.path.join(CDXSTORE, "fingerprints")
+)
+_BITS = np.arange(SIMHASH_BITS, dtype=np.uint64)
+
+# Fingerprints keyed by CDX content digest, shared by all URLs
+_stored = DiskCache(FINGERPRINT_CACHE_DIR) if FINGERPRINT_CACHE_DIR else None
+
+
+def _hash64(s):
+    return int.from_bytes(blake2b(s.encode(), digest_size=8).digest(), "little")
+
+
+def simhash(text):
+    """Return the 64-bit SimHash of the word shingles of `text`."""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return 0
+    n = max(len(words) - SHINGLE + 1, 1)
+    shingles = {" ".join(words[i : i + SHINGLE]) for i in range(n)}
+    hashes = np.fromiter(
+        (_hash64(s) for s in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    ones = ((hashes[:, None] >> _BITS) & np.uint64(1)).sum(axis=0)
+    return sum(1 << int(i) for i in np.flatnonzero(2 * ones > len(hashes)))
+
+
+def similarity(a, b):
+    """Estimate the similarity of two SimHashes as the share of equal bits."""
+    return 1 - bin(a ^ b).count("1") / SIMHASH_BITS
+
+
+def sample_captures(index, samples=SAMPLES):
+    """Pick up to `samples` 2xx captures spread evenly over the capture history.
+
+    Consecutive picks with the same digest are collapsed into the first one.
+    """
+    ok = np.flatnonzero(index.codes == OK)
+    if not len(ok):
+        return []
+    pos = ok[np.unique(np.linspace(0, len(ok) - 1, samples).round().astype(int))]
+    dig = index.digest[pos]
+    keep = np.ones(len(pos), dtype=bool)
+    keep[1:] = dig[1:] != dig[:-1]
+    return [index.capture(i) for i in pos[keep]]
+
+
+def fingerprint_captures(url, captures=None, samples=SAMPLES):
+    """Return `captures` of `url` with their `fingerprint`, computing missing ones.
+
+    Without `captures`, `sample_captures` picks them. Captures whose text could
+    not be fetched are left out. New fingerprints are stored on disk as well.
+    """
+    index = capture_index(url)
+    if captures is None:
+        captures = sample_captures(index, samples)
+    todo = {}
+    for c in captures:
+        d = c["digest"]
+        if d in index.fingerprints or d in todo:
+            continue
+        fp = _stored.get(("simhash", SHINGLE, d)) if _stored is not None else None
+        if fp is None:
+            todo[d] = c["timestamp"]
+        else:
+            index.fingerprints[d] = fp
+    for snap in fetch_snapshots([(url, ts) for ts in todo.values()]):
+        if snap["text"]:
+            fp = index.fingerprints[snap["digest"]] = simhash(snap["text"])
+            if _stored is not None:
+                _stored.set(("simhash", SHINGLE, snap["digest"]), fp)
+    return [
+        dict(c, fingerprint=index.fingerprints[c["digest"]])
+        for c in captures
+        if c["digest"] in index.fingerprints
+    ]
+
+
+def compare_captures(url, a, b):
+    """Compare the captures of `url` closest to timestamps `a` and `b`."""
+    index = capture_index(url)
+    ca, cb = index.nearest(a), index.nearest(b)
+    if ca is None or cb is None:
+        raise ValueError(f"No snapshot data available for {url}")
+    fps = {
+        c["timestamp"]: c["fingerprint"] for c in fingerprint_captures(url, [ca, cb])
+    }
+    if ca["timestamp"] not in fps or cb["timestamp"] not in fps:
+        raise ValueError(f"Could not fetch the text of the captures of {url}")
+    return {
+        "a": ca,
+        "b": cb,
+        "similarity": similarity(fps[ca["timestamp"]], fps[cb["timestamp"]]),
+    }
+
+
+def content_shifts(url, samples=SAMPLES, top=5):
+    """Return the `top` least similar pairs of consecutive sampled captures."""
+    fps = fingerprint_captures(url, samples=samples)
+    shifts = [
+        {
+            "from": a["timestamp"],
+            "to": b["timestamp"],
+            "similarity": similarity(a["fingerprint"], b["fingerprint"]),
+        }
+        for a, b in zip(fps, fps[1:])
+    ]
+    return sorted(shifts, key=lambda s: s["similarity"])[:top]
@@ -1,4 +1,4 @@
-import requests
+from utils.httpclient import get_session
 
 def get_snapshot_data(url, timestamp, job_id):
     """
@@ -15,7 +15,7 @@ def get_snapshot_data(url, timestamp, job_id):
     base_url = "https://web.archive.org/web"
     snapshot_url = f"{base_url}/{timestamp}id_{job_id}/{url}"
 
-    response = requests.get(snapshot_url)
+    response = get_session().get(snapshot_url)
 
     if response.status_code == 200:
         return response.text
@@ -0,0 +1,111 @@
+"""Concurrent retrieval of many Wayback Machine snapshots.
+
+Each job resolves the capture closest to a requested timestamp, fetches its
+`id_` playback body and extracts the text, unless the capture's digest is
+already in the snapshot text cache. Jobs run concurrently on the event
+loop's thread pool through the shared HTTP session, with at most
+`SNAPSHOT_CONCURRENCY` requests in flight per host, and results are yielded in
+completion order::
+
+    async for snap in iter_snapshots(snapshot_jobs(url, ["2005", "2010"])):
+        print(snap["timestamp"], snap["error"] or snap["text"][:80])
+
+`fetch_snapshots` drives the same loop from synchronous code, e.g. a
+Streamlit script.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+
+from utils.fetch_data_wayback import (
+    CDXAPI,
+    closest_capture,
+    snapshot_text,
+    snapshot_texts,
+)
+
+WBM = "https://web.archive.org/web"
+SNAPSHOT_CONCURRENCY = int(os.getenv("SNAPSHOT_CONCURRENCY", "6"))
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_jobs(urls, timestamps=None):
+    """Expand one URL with many timestamps, or many URLs, into (url, timestamp) jobs."""
+    if isinstance(urls, str):
+        urls = [urls]
+    return [(u, t) for u in urls for t in (timestamps or [None])]
+
+
+async def _fetch_snapshot(url, timestamp, limits):
+    loop = asyncio.get_running_loop()
+    snap = {
+        "url": url,
+        "requested": timestamp,
+        "timestamp": None,
+        "digest": None,
+        "text": None,
+        "error": None,
+    }
+    try:
+        async with limits[urlsplit(CDXAPI).netloc]:
+            snap["timestamp"], snap["digest"] = await loop.run_in_executor(
+                None, closest_capture, url, timestamp
+            )
+        digest = snap["digest"]
+        snap["text"] = snapshot_texts.get(digest)
+        if snap["text"] is None:
+            playback = f"{WBM}/{snap['timestamp']}id_/{url}"
+            async with limits[urlsplit(playback).netloc]:
+                snap["text"] = await loop.run_in_executor(
+                    None, snapshot_text, url, playback
+                )
+            snapshot_texts.set(digest, snap["text"])
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Error fetching snapshot of {url} at {timestamp}: {e}")
+        snap["error"] = str(e)
+    except Exception as e:
+        logger.error(f"Unexpected error fetching snapshot of {url} at {timestamp}: {e}")
+        snap["error"] = str(e)
+    return snap
+
+
+async def iter_snapshots(jobs, concurrency=SNAPSHOT_CONCURRENCY):
+    """Fetch `(url, timestamp)` jobs concurrently and yield results as they finish.
+
+    Every result is a dict with the `url`, the `requested` and resolved
+    `timestamp`, the capture's `digest`, the extracted `text` and an `error`
+    message, if any.
+    """
+    limits = defaultdict(lambda: asyncio.Semaphore(concurrency))
+    tasks = [asyncio.ensure_future(_fetch_snapshot(u, t, limits)) for u, t in jobs]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def fetch_snapshots(jobs, concurrency=SNAPSHOT_CONCURRENCY):
+    """Synchronous generator over `iter_snapshots`, run on a background event loop."""
+    results = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for snap in iter_snapshots(jobs, concurrency):
+                results.put(snap)
+        finally:
+            results.put(done)
+
+    threading.Thread(target=asyncio.run, args=(pump(),), daemon=True).start()
+    while (snap := results.get()) is not done:
+        yield snap
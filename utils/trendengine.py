@@ -0,0 +1,471 @@
+"""Streamlit-free resilience, fixity and chaos computation.
+
+`trend_frames` runs the whole analysis for a URL and `trend_job` wraps it for
+`ProcessPoolExecutor.submit`, e.g.
+
+    with ProcessPoolExecutor() as pool:
+        d, trs, psc = pool.submit(trend_job, "example.com").result()
+"""
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from math import exp
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import MemoryCache
+from utils.cdxengine import CDXENGINE, DailyRecord, cdx_summary
+
+WBM = "https://web.archive.org/web"
+STATUSES = ("2xx", "3xx", "4xx", "5xx")
+SIGMAX = 1 << 16
+SIGPARAMS = {
+    "2xx": (4, 1.0, 1.0),
+    "3xx": (5, 10.0, -0.5),
+    "4xx": (5, 1.0, -1.0),
+    "5xx": (5, 1.0, -1.0),
+    "~": (10, 20.0, -0.5),
+    "Changed": (6, 1.0, -1.0),
+    "Unchanged": (4, 1.0, 1.0),
+    "Unknown": (10, 30.0, -0.5),
+}
+_job_cache = MemoryCache(maxsize=32, ttl=3600)
+_job_states = MemoryCache(maxsize=256)
+
+
+def ymd(d):
+    y, d = divmod(d, 365)
+    m, d = divmod(d, 30)
+    if y or m > 6:
+        if d > 15:
+            m += 1
+        d = 0
+    if m == 12:
+        y += 1
+        m = 0
+    t = {"y": y, "m": m, "d": d}
+    return "".join([s for k, v in t.items() if v for s in (str(v), k)])
+
+
+def sigmoid(x, shift=5, slope=1, spread=1):
+    return spread / (1 + exp(shift - x / slope))
+
+
+@lru_cache(maxsize=None)
+def sigmoid_table(shift=5, slope=1, spread=1):
+    """Return `(table, saturated)` with `table[x] == sigmoid(x, ...)`.
+
+    Run positions are small integers and the curve reaches `spread` exactly
+    once `exp` drops below the float resolution of 1, so for a positive slope
+    the table stops there and its last value holds for every larger `x`.
+    """
+    vals = []
+    for x in range(SIGMAX):
+        d = 1 + exp(shift - x / slope)
+        vals.append(spread / d)
+        if d == 1.0 and slope > 0:
+            return np.array(vals), True
+    return np.array(vals), False
+
+
+def sigmoid_batch(x, codes, params):
+    """Vectorized `sigmoid(x[i], *params[codes[i]])` using `sigmoid_table`."""
+    x = np.asarray(x)
+    out = np.empty(len(x))
+    for c, p in enumerate(params):
+        m = codes == c
+        if not m.any():
+            continue
+        table, saturated = sigmoid_table(*p)
+        xm = x[m]
+        if saturated:
+            out[m] = table[np.minimum(xm, len(table) - 1)]
+        elif xm.max() < len(table):
+            out[m] = table[xm]
+        else:
+            out[m] = [sigmoid(i, *p) for i in xm.tolist()]
+    return out
+
+
+def fill_identical(f, lk, lv, rk, rv, gap):
+    if lv != rv:
+        return
+    for day in pd.date_range(lk, rk, inclusive="neither"):
+        t = day.strftime("%Y-%m-%d")
+        f[t] = DailyRecord(t, specimen=lv)
+
+
+def fill_closest(f, lk, lv, rk, rv, gap):
+    mid = gap / 2
+    for i, day in enumerate(pd.date_range(lk, rk, inclusive="neither")):
+        t = day.strftime("%Y-%m-%d")
+        f[t] = DailyRecord(t, specimen=lv) if i < mid else DailyRecord(t, specimen=rv)
+
+
+def fill_forward(f, lk, lv, rk, rv, gap):
+    for day in pd.date_range(lk, rk, inclusive="neither"):
+        t = day.strftime("%Y-%m-%d")
+        f[t] = DailyRecord(t, specimen=lv)
+
+
+def fill_backward(f, lk, lv, rk, rv, gap):
+    for day in pd.date_range(lk, rk, inclusive="neither"):
+        t = day.strftime("%Y-%m-%d")
+        f[t] = DailyRecord(t, specimen=rv)
+
+
+fillpolicies = {
+    "identical": fill_identical,
+    "closest": fill_closest,
+    "forward": fill_forward,
+    "backward": fill_backward,
+}
+
+
+def filler(drs, fill, policy):
+    f = {}
+    kv = iter(drs.items())
+    pk, pv = next(kv)
+    pv = pv.specimen
+    pk = pd.to_datetime(pk)
+    for k, v in kv:
+        v = v.specimen
+        k = pd.to_datetime(k)
+        gap = (k - pk).days - 1
+        if gap and (fill == -1 or gap <= fill):
+            fillpolicies[policy](f, pk, pv, k, v, gap)
+        pk, pv = k, v
+    return f
+
+
+def sigmoid_runs(labels, sigparams, state=("~", 0.5, 0.5, 0, 0.5)):
+    """Evaluate the resilience/fixity recurrence over a per-day label array.
+
+    Each run of equal labels follows the sigmoid of its `sigparams` entry,
+    starting from the value the previous run ended at, exactly like the
+    original day-by-day loop. Only the carry-over between runs is computed in
+    Python; everything per day is vectorized.
+
+    `state` is the `(label, base, scale, x, h)` of the day before `labels[0]`;
+    the returned state is the one after the last label.
+    """
+    n = len(labels)
+    if not n:
+        return np.empty(0), state
+    label0, base0, scale0, x0, h = state
+    uniq, codes = np.unique(labels, return_inverse=True)
+    params = [sigparams.get(u) for u in uniq]
+    start = np.ones(n, dtype=bool)
+    start[1:] = codes[1:] != codes[:-1]
+    starts = np.flatnonzero(start)
+    ends = np.append(starts[1:], n) - 1
+    run = np.cumsum(start) - 1
+    x = np.arange(n) - starts[run] + 1
+    cont = labels[0] == label0
+    if cont:
+        x[: ends[0] + 1] += x0
+    sig = sigmoid_batch(x, codes, params)
+    bases = np.empty(len(starts))
+    scales = np.empty(len(starts))
+    for r, (c, e) in enumerate(zip(codes[starts].tolist(), ends.tolist())):
+        if r == 0 and cont:
+            base, scale = base0, scale0
+        else:
+            base = h
+            scale = base if params[c][2] < 0 else 1 - base
+        h = base + scale * sig[e]
+        bases[r] = base
+        scales[r] = scale
+    values = bases[run] + scales[run] * sig
+    return values, (labels[-1], bases[-1], scales[-1], int(x[-1]), h)
+
+
+def status_codes(specimen):
+    """Map specimen labels to indexes into `STATUSES`, -1 for `~` and others."""
+    return pd.Index(STATUSES).get_indexer(np.asarray(specimen, dtype=object))
+
+
+def transition_counts(seq, k=1):
+    """Count `seq[i] -> seq[i + k]` transitions as a `[source, target]` matrix."""
+    n = len(STATUSES)
+    if len(seq) <= k:
+        return np.zeros((n, n), dtype=np.int64)
+    pairs = seq[:-k] * n + seq[k:]
+    return np.bincount(pairs, minlength=n * n).reshape(n, n)
+
+
+def transition_frame(counts, value_name="Count"):
+    """Melt a `[source, target]` matrix into Source/Target/value rows."""
+    return pd.DataFrame(
+        {
+            "Source": list(STATUSES) * len(STATUSES),
+            "Target": [t for t in STATUSES for _ in STATUSES],
+            value_name: counts.T.ravel(),
+        }
+    )
+
+
+def transition_stats(specimen, steps=(1, 7, 30)):
+    """Multi-step transition probabilities and mean dwell time per status.
+
+    Days without a known status are skipped, as in the transition counts of
+    `build_trend_frames`. `steps` maps each `k` to a row-normalized `[source,
+    target]` probability matrix between observations `k` apart, and `dwell`
+    maps each status to the mean number of days a run of it lasted, counting
+    the last run up to the last observed day.
+    """
+    codes = status_codes(specimen)
+    pos = np.flatnonzero(codes >= 0)
+    seq = codes[pos]
+    res = {"steps": {}, "dwell": {}}
+    for k in steps:
+        counts = transition_counts(seq, k)
+        total = counts.sum(axis=1, keepdims=True)
+        res["steps"][k] = np.divide(
+            counts, total, out=np.zeros(counts.shape), where=total > 0
+        )
+    if not len(seq):
+        return res
+    start = np.ones(len(seq), dtype=bool)
+    start[1:] = seq[1:] != seq[:-1]
+    begins = pos[start]
+    lengths = np.append(begins[1:], pos[-1] + 1) - begins
+    labels = seq[start]
+    for c, status in enumerate(STATUSES):
+        if (labels == c).any():
+            res["dwell"][status] = float(lengths[labels == c].mean())
+    return res
+
+
+@dataclass
+class TrendState:
+    """Recurrence state of a computed series at its checkpoint day.
+
+    `frame` holds the final rows up to and including `day`, the day before the
+    last record, since that day may still gain captures. `nrecords` and
+    `boundary` (the last record up to `day`) detect backfilled captures.
+    """
+
+    first: str
+    day: str
+    nrecords: int = 0
+    boundary: tuple = None
+    frame: pd.DataFrame = None
+    resilience: tuple = ("~", 0.5, 0.5, 0, 0.5)
+    fixity: tuple = ("Unknown", 0.5, 0.5, 0, 0.5)
+    chaos: tuple = (0.0, 0.0)
+    transitions: tuple = (None, None)
+
+
+def _trend_segment(records, days, url, sigparams, state):
+    """Compute the daily frame rows for `days`, continuing from `state`."""
+    n = len(days)
+    if not n:
+        return None, state
+    if records:
+        off = (pd.to_datetime(list(records)) - days[0]).days.to_numpy()
+    else:
+        off = np.zeros(0, dtype=np.int64)
+    keep = (off >= 0) & (off < n)
+    idx = off[keep]
+    recs = [r for r, k in zip(records.values(), keep.tolist()) if k]
+    cols = dict(zip(DailyRecord.FIELDS, zip(*(r.astuple() for r in recs))))
+
+    def column(k, default, dtype=object):
+        a = np.full(n, default, dtype=dtype)
+        if recs:
+            a[idx] = cols[k]
+        return a
+
+    pch, pchn = state.chaos
+    chaos = column("chaos", 0.0, float)
+    chaosn = column("chaosn", 0.0, float)
+    last = np.maximum.accumulate(np.where(chaos != 0, np.arange(n), -1))
+    chaos = np.where(last >= 0, chaos[np.maximum(last, 0)], pch)
+    chaosn = np.where(last >= 0, chaosn[np.maximum(last, 0)], pchn)
+    specimen = column("specimen", "~")
+    content = column("content", "Unknown")
+    resilience, rstate = sigmoid_runs(specimen, sigparams, state.resilience)
+    fixity, fstate = sigmoid_runs(content, sigparams, state.fixity)
+    resdf = pd.DataFrame(
+        {
+            "Day": days.strftime("%Y-%m-%d"),
+            "Datetime": column("datetime", "~"),
+            "2xx": column("_2xx", 0, np.int64),
+            "3xx": column("_3xx", 0, np.int64),
+            "4xx": column("_4xx", 0, np.int64),
+            "5xx": column("_5xx", 0, np.int64),
+            "All": column("all", 0, np.int64),
+            "Specimen": specimen,
+            "Filled": column("filled", False, bool),
+            "Resilience": resilience,
+            "Digest": column("digest", "~"),
+            "Content": content,
+            "Fixity": fixity,
+            "Chaos": chaos,
+            "Chaosn": chaosn,
+        }
+    )
+    resdf["URIM"] = (f"{WBM}/" + resdf["Datetime"] + f"/{url}").where(
+        resdf["Datetime"] != "~", "#"
+    )
+    trs, pr = state.transitions
+    codes = status_codes(specimen)
+    if pr is None:
+        pr, codes = codes[0], codes[1:]
+    seq = np.append(pr, codes[codes >= 0]) if pr >= 0 else np.zeros(0, np.int64)
+    counts = transition_counts(seq)
+    trs = counts if trs is None else trs + counts
+    pr = int(seq[-1]) if len(seq) else int(pr)
+    state = replace(
+        state,
+        resilience=rstate,
+        fixity=fstate,
+        chaos=(float(chaos[-1]), float(chaosn[-1])),
+        transitions=(trs, pr),
+    )
+    return resdf, state
+
+
+def _concat(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return pd.concat([a, b], ignore_index=True)
+
+
+def _advance(state, records, url, sigparams):
+    """Extend `state` by `records` (all after `state.day`) up to today.
+
+    Returns the full daily frame, the state at the new checkpoint (the day
+    before the last record) and the state at today.
+    """
+    start = pd.to_datetime(state.day) + pd.Timedelta(days=1)
+    today = pd.to_datetime("today")
+    day = state.day
+    if records:
+        last = min(pd.to_datetime(max(records)), today.normalize())
+        day = max(day, (last - pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+    done = {k: r for k, r in records.items() if k <= day}
+    head, cp = _trend_segment(done, pd.date_range(start, day), url, sigparams, state)
+    boundary = done[max(done)].astuple() if done else state.boundary
+    cp = replace(
+        cp,
+        day=day,
+        nrecords=state.nrecords + len(done),
+        boundary=boundary,
+        frame=_concat(state.frame, head),
+    )
+    rest = pd.date_range(pd.to_datetime(day) + pd.Timedelta(days=1), today)
+    tail, final = _trend_segment(records, rest, url, sigparams, cp)
+    return _concat(cp.frame, tail), cp, final
+
+
+def _new_records(date_record, state):
+    """Return the records after `state.day`, or None if older ones changed."""
+    if state is None or next(iter(date_record)) != state.first:
+        return None
+    new = {}
+    boundary = None
+    for k in reversed(date_record):
+        if k <= state.day:
+            boundary = date_record[k].astuple()
+            break
+        new[k] = date_record[k]
+    if len(date_record) - len(new) != state.nrecords or boundary != state.boundary:
+        return None
+    return dict(reversed(new.items()))
+
+
+def build_trend_frames(cdx, url, fill, policy, sigparams, states=None):
+    """Compute the daily, transition and sample frames from a CDX summary.
+
+    `cdx` is the `(date_record, samples)` pair returned by `cdx_summary`. The
+    records are laid out on a day-indexed array from the first record to today
+    and the resilience, fixity and chaos columns are computed on those arrays.
+
+    With a `states` cache the recurrence state at the last checkpoint is kept
+    per URL, and later calls only compute the days after it. Backfilled
+    captures before the checkpoint and fill policies force a full recompute.
+    """
+    date_record, psc = cdx
+    if not date_record:
+        raise ValueError(f"Empty or malformed CDX API response for `{url}`")
+    key = ("trendstate", url, tuple(sigparams.items()))
+    state = states.get(key) if states is not None and fill == 0 else None
+    records = _new_records(date_record, state)
+    if records is None:
+        date_record = dict(date_record)
+        if fill != 0:
+            date_record.update(filler(date_record, fill, policy))
+        first = next(iter(date_record))
+        day = (pd.to_datetime(first) - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        state = TrendState(first, day, nrecords=sum(k <= day for k in date_record))
+        records = {k: r for k, r in date_record.items() if k > day}
+    resdf, cp, final = _advance(state, records, url, sigparams)
+    if states is not None and fill == 0:
+        states.set(key, cp)
+    trsdf = transition_frame(final.transitions[0])
+    pscdf = (
+        pd.DataFrame.from_dict(psc, orient="index", columns=["Samples"])
+        .reset_index()
+        .rename(columns={"index": "Period"})
+    )
+    return (resdf, trsdf, pscdf)
+
+
+def trend_frames(
+    url,
+    fill=0,
+    policy="identical",
+    sigparams=SIGPARAMS,
+    engine=CDXENGINE,
+    progress=None,
+    cache=None,
+    states=None,
+):
+    """Return `(resdf, trsdf, pscdf)` for `url`, the result of `load_data`."""
+    key = ("trends", url, fill, policy, tuple(sigparams.items()), engine)
+    res = cache.get(key) if cache is not None else None
+    if res is None:
+        cdx = cdx_summary(url, engine, progress, cache)
+        res = build_trend_frames(cdx, url, fill, policy, sigparams, states)
+        if cache is not None:
+            cache.set(key, res)
+    return res
+
+
+def trend_summary(d):
+    stats = transition_stats(d["Specimen"], steps=(30,))
+    return {
+        "captures": int(d["All"].sum()),
+        "span": len(d),
+        "gaps": int((d["All"] == 0).sum()),
+        "resilience": float(d["Resilience"].iloc[-1]),
+        "resilience_trend": (
+            float(d["Resilience"].iloc[-1] - d["Resilience"].iloc[-2])
+            if len(d) > 1
+            else 0
+        ),
+        "fixity": float(d["Fixity"].iloc[-1]),
+        "fixity_trend": (
+            float(d["Fixity"].iloc[-1] - d["Fixity"].iloc[-2]) if len(d) > 1 else 0
+        ),
+        "chaos": float(d["Chaos"].iloc[-1]),
+        "chaos_trend": (
+            float(d["Chaos"].iloc[-1] - d["Chaos"].iloc[-2]) if len(d) > 1 else 0
+        ),
+        "status_distribution": d[["2xx", "3xx", "4xx", "5xx"]].sum().to_dict(),
+        "status_dwell": stats["dwell"],
+        "status_stay": {
+            s: float(stats["steps"][30][i, i]) for i, s in enumerate(STATUSES)
+        },
+    }
+
+
+def trend_job(url, fill=0, policy="identical", sigparams=SIGPARAMS, engine=CDXENGINE):
+    """Picklable entry point for worker processes, cached per process."""
+    return trend_frames(
+        url, fill, policy, sigparams, engine, cache=_job_cache, states=_job_states
+    )